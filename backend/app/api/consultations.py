@@ -4,19 +4,21 @@ Unified endpoint for audio upload + transcription + SOAP generation
 """
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Literal
 from app.database import get_supabase, get_supabase_service
 from app.api.auth import get_current_user
 from app.config import settings
 from app.services.transcription_service import transcription_service
-from app.services.soap_service import soap_service
+from app.services.soap_service import get_soap_service
+from app.services.loop_clients import aclose_loop_clients
 # PDF service imported lazily to avoid startup errors if WeasyPrint dependencies missing
 import uuid
 from datetime import datetime
 import asyncio
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -107,7 +109,7 @@ def process_consultation_background(
             
             # Step 2: Generate SOAP note
             logger.info(f"📋 Generating SOAP note with Groq LLM")
-            soap_result = await soap_service.generate_soap_note(
+            soap_result = await get_soap_service().generate_soap_note(
                 transcript=transcript,
                 language=language,
                 patient_name=patient_name,
@@ -193,6 +195,8 @@ def process_consultation_background(
             loop.run_until_complete(_process())
             logger.info(f"✅ Background task completed for consultation {consultation_id}")
         finally:
+            # Close this loop's SDK clients (their connection pools die with the loop)
+            loop.run_until_complete(aclose_loop_clients())
             loop.close()
     except Exception as e:
         logger.error(f"❌ Background task exception for consultation {consultation_id}: {str(e)}", exc_info=True)
@@ -465,6 +469,53 @@ async def get_consultation(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get consultation: {str(e)}")
 
+@router.get("/{consultation_id}/soap/stream")
+async def stream_consultation_soap(
+    consultation_id: str,
+    current_user = Depends(get_current_user)
+):
+    """
+    Regenerate the SOAP draft for a transcribed consultation as Server-Sent Events
+    
+    Emits one "section" event per SOAP field as soon as Gemini completes it,
+    then a "done" event (or an "error" event if generation fails).
+    """
+    supabase = get_supabase_service()
+    
+    try:
+        consultation_response = supabase.table("consultations")\
+            .select("transcript, language")\
+            .eq("id", consultation_id)\
+            .eq("user_id", current_user.id)\
+            .single()\
+            .execute()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get consultation: {str(e)}")
+    
+    consultation = consultation_response.data
+    if not consultation:
+        raise HTTPException(status_code=404, detail="Consultation not found")
+    if not consultation.get("transcript"):
+        raise HTTPException(status_code=400, detail="Consultation has no transcript yet")
+    
+    async def events():
+        try:
+            async for field, value in get_soap_service().stream_soap_sections(
+                consultation["transcript"], consultation["language"]
+            ):
+                payload = orjson.dumps({"field": field, "value": value}).decode()
+                yield f"event: section\ndata: {payload}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            logger.error(f"SOAP stream failed for consultation {consultation_id}: {e}")
+            yield f"event: error\ndata: {orjson.dumps({'message': str(e)}).decode()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{consultation_id}/pdf")
 async def get_consultation_pdf(
     consultation_id: str,
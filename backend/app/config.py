@@ -13,6 +13,7 @@ class Settings(BaseSettings):
     APP_NAME: str = "MedScribe AI"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
     # Supabase Settings
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
@@ -26,6 +27,31 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     ASSEMBLYAI_API_KEY: str = os.getenv("ASSEMBLYAI_API_KEY", "")
     
+    # Maximum concurrent upstream transcription calls (AssemblyAI/Reverie) across all consultations
+    TRANSCRIPTION_MAX_CONCURRENT: int = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENT", "5"))
+    
+    # Uploads larger than this are split on silence and the chunks transcribed in parallel
+    TRANSCRIPTION_CHUNK_THRESHOLD_BYTES: int = int(os.getenv("TRANSCRIPTION_CHUNK_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+    TRANSCRIPTION_CHUNK_SECONDS: int = int(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "120"))
+    
+    # Maximum concurrent Groq requests across all consultations (avoids 429 storms)
+    GROQ_CONCURRENCY: int = int(os.getenv("GROQ_CONCURRENCY", "8"))
+    
+    # Also fire the fallback model if the primary hasn't opened its stream within this
+    # many ms (a second paid request; 0 = off, fall back only when the primary model fails)
+    GROQ_HEDGE_AFTER_MS: int = int(os.getenv("GROQ_HEDGE_AFTER_MS", "0"))
+    
+    # Semantic SOAP cache (reuses notes for near-duplicate transcripts) - off by default:
+    # a near-duplicate transcript can differ in clinically significant details (dose,
+    # laterality, negation), and a reused note carries another patient's data (PHI)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    
+    # SOAP request micro-batching (coalesces concurrent consultations into one Gemini call)
+    SOAP_BATCHING_ENABLED: bool = os.getenv("SOAP_BATCHING_ENABLED", "False").lower() == "true"
+    SOAP_BATCH_WINDOW_MS: int = int(os.getenv("SOAP_BATCH_WINDOW_MS", "50"))
+    SOAP_BATCH_SIZE: int = int(os.getenv("SOAP_BATCH_SIZE", "4"))
+    
     # CORS
     CORS_ORIGINS: str = os.getenv("CORS_ORIGINS", "http://localhost:3000")
     
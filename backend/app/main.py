@@ -12,6 +12,12 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from app.config import settings
+from app.logging_config import setup_logging
+
+# Non-blocking logging (records are flushed by a background listener thread)
+setup_logging(settings.LOG_LEVEL)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="MedScribe AI API",
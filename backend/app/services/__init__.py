@@ -4,12 +4,12 @@ Contains business logic services for transcription, SOAP generation, etc.
 """
 
 from .transcription_service import transcription_service, TranscriptionService
-from .soap_service import soap_service, SOAPGenerationService
+from .soap_service import get_soap_service, SOAPGenerationService
 
 __all__ = [
     "transcription_service",
     "TranscriptionService",
-    "soap_service",
+    "get_soap_service",
     "SOAPGenerationService"
 ]
 
@@ -5,9 +5,11 @@ Provides speaker diarization and medical transcription with 96% accuracy
 
 import assemblyai as aai
 from app.config import settings
+import asyncio
+import io
 import logging
+import threading
 from typing import Dict, Any, Optional
-import os
 
 logger = logging.getLogger(__name__)
 
@@ -18,24 +20,34 @@ class AssemblyAIService:
         """Initialize AssemblyAI client (lazy initialization)"""
         self.transcriber = None
         self._initialized = False
+        # Consultations run on their own threads - make sure only one transcriber is ever built
+        self._init_lock = threading.Lock()
     
     def _ensure_initialized(self):
         """Lazy initialization - only create transcriber when needed"""
         if self._initialized:
             return
         
-        if not settings.ASSEMBLYAI_API_KEY:
-            raise ValueError("ASSEMBLYAI_API_KEY not set. Please set it in environment variables.")
-        
-        aai.settings.api_key = settings.ASSEMBLYAI_API_KEY
-        self.transcriber = aai.Transcriber()
-        self._initialized = True
+        with self._init_lock:
+            if self._initialized:
+                return
+            
+            if not settings.ASSEMBLYAI_API_KEY:
+                raise ValueError("ASSEMBLYAI_API_KEY not set. Please set it in environment variables.")
+            
+            aai.settings.api_key = settings.ASSEMBLYAI_API_KEY
+            # The SDK's default client holds one pooled keep-alive HTTP connection pool,
+            # shared by every request made through this transcriber
+            self.transcriber = aai.Transcriber()
+            self._initialized = True
     
     async def transcribe_with_diarization(
         self,
-        audio_url: str,
+        audio_url: Optional[str] = None,
         language: str = "ta",
-        doctor_voiceprint: Optional[str] = None
+        doctor_voiceprint: Optional[str] = None,
+        audio_bytes: Optional[bytes] = None,
+        enable_diarization: bool = True
     ) -> Dict[str, Any]:
         """
         Transcribe audio with speaker diarization using AssemblyAI
@@ -44,6 +56,8 @@ class AssemblyAIService:
             audio_url: URL or file path to audio file
             language: Language code ("ta" for Tamil, "te" for Telugu)
             doctor_voiceprint: Optional doctor voiceprint ID for better accuracy
+            audio_bytes: In-memory audio data (uploaded directly instead of audio_url)
+            enable_diarization: Request speaker labels (otherwise text is split by keywords)
         
         Returns:
             Dictionary with transcription and diarization results:
@@ -73,15 +87,17 @@ class AssemblyAIService:
             
             # Configure transcription with speaker diarization
             config = aai.TranscriptionConfig(
-                speaker_labels=True,  # Enable speaker diarization
+                speaker_labels=enable_diarization,  # Speaker diarization only when requested
                 language_code=lang_code,
                 # Note: auto_punctuation not available in all SDK versions, using punctuate instead
                 punctuate=True,  # Auto punctuation (alternative to auto_punctuation)
                 format_text=True,
             )
             
-            # Transcribe audio
-            transcript = self.transcriber.transcribe(audio_url, config)
+            # Transcribe audio (in-memory data is uploaded as a file-like, no temp file)
+            # The SDK call blocks (upload + polling) - run it off the event loop
+            source = io.BytesIO(audio_bytes) if audio_bytes is not None else audio_url
+            transcript = await asyncio.to_thread(self.transcriber.transcribe, source, config)
             
             if transcript.error:
                 raise Exception(f"AssemblyAI transcription error: {transcript.error}")
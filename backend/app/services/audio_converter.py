@@ -3,20 +3,39 @@ Audio Format Converter Service
 Converts audio files to formats supported by transcription APIs
 """
 
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from io import BytesIO
-from typing import Tuple
+from typing import List, Optional, Tuple
 from pydub import AudioSegment
-import tempfile
-import os
+from pydub.silence import detect_silence
 
 logger = logging.getLogger(__name__)
 
+# mutagen reads duration from container headers without decoding (optional)
+try:
+    from mutagen import File as MutagenFile
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MutagenFile = None
+    MUTAGEN_AVAILABLE = False
+    logger.info("mutagen not installed; audio duration will be estimated from file size")
+
+# Converted-audio LRU bounds (retries and re-uploads of the same recording skip ffmpeg)
+CONVERSION_CACHE_MAX_ENTRIES = 64
+CONVERSION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 
 class AudioConverter:
     """Service for converting audio files to supported formats"""
 
     def __init__(self):
+        # (content hash, source format) -> (converted bytes, target format)
+        self._conversion_cache: OrderedDict = OrderedDict()
+        self._conversion_cache_bytes = 0
+        self._conversion_cache_lock = threading.Lock()
         logger.info("🔄 AudioConverter initialized")
 
     def convert_to_mp3(
@@ -37,29 +56,18 @@ class AudioConverter:
         try:
             logger.info(f"Converting audio from {source_format} to MP3")
             
-            # Create temporary file for input
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{source_format}") as temp_input:
-                temp_input.write(audio_data)
-                temp_input_path = temp_input.name
+            # Load audio file (piped to ffmpeg from memory - no temp file copy;
+            # BytesIO over bytes shares the buffer until written to)
+            audio = AudioSegment.from_file(BytesIO(audio_data), format=source_format)
+            
+            # Export to MP3
+            output_buffer = BytesIO()
+            audio.export(output_buffer, format="mp3", bitrate="128k")
+            converted_data = output_buffer.getvalue()
+            
+            logger.info(f"✅ Successfully converted {source_format} to MP3 ({len(converted_data)} bytes)")
+            return converted_data, "mp3"
             
-            try:
-                # Load audio file
-                audio = AudioSegment.from_file(temp_input_path, format=source_format)
-                
-                # Export to MP3
-                output_buffer = BytesIO()
-                audio.export(output_buffer, format="mp3", bitrate="128k")
-                output_buffer.seek(0)
-                converted_data = output_buffer.read()
-                
-                logger.info(f"✅ Successfully converted {source_format} to MP3 ({len(converted_data)} bytes)")
-                return converted_data, "mp3"
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_input_path):
-                    os.unlink(temp_input_path)
-                    
         except Exception as e:
             logger.error(f"❌ Audio conversion failed: {str(e)}", exc_info=True)
             raise Exception(f"Failed to convert audio from {source_format} to MP3: {str(e)}")
@@ -82,34 +90,22 @@ class AudioConverter:
         try:
             logger.info(f"Converting audio from {source_format} to WAV")
             
-            # Create temporary file for input
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{source_format}") as temp_input:
-                temp_input.write(audio_data)
-                temp_input_path = temp_input.name
+            # Load audio file (piped to ffmpeg from memory - no temp file copy)
+            audio = AudioSegment.from_file(BytesIO(audio_data), format=source_format)
+            
+            # Convert to 16kHz, 16-bit, mono (Reverie format)
+            audio = audio.set_frame_rate(16000)
+            audio = audio.set_sample_width(2)  # 16-bit
+            audio = audio.set_channels(1)  # Mono
+            
+            # Export to WAV
+            output_buffer = BytesIO()
+            audio.export(output_buffer, format="wav")
+            converted_data = output_buffer.getvalue()
+            
+            logger.info(f"✅ Successfully converted {source_format} to WAV ({len(converted_data)} bytes)")
+            return converted_data, "wav"
             
-            try:
-                # Load audio file
-                audio = AudioSegment.from_file(temp_input_path, format=source_format)
-                
-                # Convert to 16kHz, 16-bit, mono (Reverie format)
-                audio = audio.set_frame_rate(16000)
-                audio = audio.set_sample_width(2)  # 16-bit
-                audio = audio.set_channels(1)  # Mono
-                
-                # Export to WAV
-                output_buffer = BytesIO()
-                audio.export(output_buffer, format="wav")
-                output_buffer.seek(0)
-                converted_data = output_buffer.read()
-                
-                logger.info(f"✅ Successfully converted {source_format} to WAV ({len(converted_data)} bytes)")
-                return converted_data, "wav"
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_input_path):
-                    os.unlink(temp_input_path)
-                    
         except Exception as e:
             logger.error(f"❌ Audio conversion failed: {str(e)}", exc_info=True)
             raise Exception(f"Failed to convert audio from {source_format} to WAV: {str(e)}")
@@ -129,6 +125,33 @@ class AudioConverter:
         Returns:
             Tuple of (converted_audio_bytes, target_format)
         """
+        if source_format.lower() == "mp3":
+            return audio_data, "mp3"
+        
+        key = (hashlib.blake2b(audio_data, digest_size=16).digest(), source_format.lower())
+        with self._conversion_cache_lock:
+            cached = self._conversion_cache.get(key)
+            if cached is not None:
+                self._conversion_cache.move_to_end(key)
+                logger.info(f"Reusing converted {source_format} audio from cache")
+                return cached
+        
+        converted = self._convert_for_reverie(audio_data, source_format)
+        
+        with self._conversion_cache_lock:
+            if key not in self._conversion_cache:
+                self._conversion_cache[key] = converted
+                self._conversion_cache_bytes += len(converted[0])
+                while (
+                    len(self._conversion_cache) > CONVERSION_CACHE_MAX_ENTRIES
+                    or self._conversion_cache_bytes > CONVERSION_CACHE_MAX_BYTES
+                ):
+                    _, (evicted, _) = self._conversion_cache.popitem(last=False)
+                    self._conversion_cache_bytes -= len(evicted)
+        return converted
+    
+    def _convert_for_reverie(self, audio_data: bytes, source_format: str) -> Tuple[bytes, str]:
+        """Uncached conversion for convert_for_reverie"""
         # Reverie prefers MP3 or 16kHz WAV
         # Convert WebM to MP3 for best compatibility
         if source_format.lower() in ["webm", "ogg", "m4a"]:
@@ -142,6 +165,66 @@ class AudioConverter:
                 return self.convert_to_mp3(audio_data, source_format)
             return audio_data, "mp3"
 
+    def duration_seconds(self, audio_data: bytes) -> Optional[float]:
+        """Audio duration read from the container header, or None if it can't be parsed"""
+        if not MUTAGEN_AVAILABLE:
+            return None
+        try:
+            parsed = MutagenFile(BytesIO(audio_data))
+        except Exception as e:
+            logger.debug(f"Could not read audio duration: {e}")
+            return None
+        if parsed is None or not getattr(parsed.info, "length", None):
+            return None
+        return float(parsed.info.length)
+
+    @staticmethod
+    def _silence_cut_points(audio: AudioSegment, chunk_ms: int, window_ms: int = 15_000) -> List[int]:
+        """Chunk boundaries in ms, from 0 to len(audio), each moved to the nearest pause"""
+        silence_thresh = audio.dBFS - 16
+        
+        cuts = [0]
+        while len(audio) - cuts[-1] > chunk_ms + window_ms:
+            target = cuts[-1] + chunk_ms
+            # Only scan the window around the boundary - silence detection is per-step RMS
+            window_start = target - window_ms
+            silences = detect_silence(
+                audio[window_start:target + window_ms],
+                min_silence_len=500, silence_thresh=silence_thresh, seek_step=50
+            )
+            pauses = [window_start + (start + end) // 2 for start, end in silences]
+            cuts.append(min(pauses, key=lambda p: abs(p - target)) if pauses else target)
+        cuts.append(len(audio))
+        return cuts
+
+    def split_on_silence_chunks(
+        self,
+        audio_data: bytes,
+        source_format: str,
+        chunk_seconds: int = 120
+    ) -> List[Tuple[bytes, float]]:
+        """
+        Split audio into roughly chunk_seconds-long MP3 chunks, cutting at pauses
+        
+        Each cut is moved to the middle of the nearest silence within 15 seconds of
+        the target boundary (a hard cut if there is none), so no audio is dropped and
+        chunk offsets stay exact.
+        
+        Returns:
+            List of (mp3_bytes, start_offset_seconds) in playback order
+        """
+        audio = AudioSegment.from_file(BytesIO(audio_data), format=source_format)
+        cuts = self._silence_cut_points(audio, chunk_seconds * 1000)
+        
+        chunks = []
+        for start, end in zip(cuts, cuts[1:]):
+            output_buffer = BytesIO()
+            audio[start:end].export(output_buffer, format="mp3", bitrate="128k")
+            chunks.append((output_buffer.getvalue(), start / 1000))
+        
+        logger.info(f"Split {len(audio) / 1000:.0f}s of audio into {len(chunks)} chunks")
+        return chunks
+
 
 audio_converter = AudioConverter()
 
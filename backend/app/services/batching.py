@@ -0,0 +1,76 @@
+"""
+Request Batching
+Coalesces concurrent SOAP requests so several consultations share one LLM call
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQueue:
+    """
+    Coalesces SOAP requests arriving within a short window into one LLM call
+    
+    Consultations are processed on separate background threads, each with its own
+    event loop, so batching uses a lock and concurrent futures rather than asyncio.
+    A future resolves to None when the request was not batched and the caller
+    should make its own request.
+    """
+    
+    def __init__(self, generate_batch, max_batch_size: int = 4, window_seconds: float = 0.05):
+        self._generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self._pending: list = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+    
+    def enqueue(self, request: tuple) -> Future:
+        """Add a request to the current batch window"""
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((request, future))
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        
+        if batch:
+            threading.Thread(target=self._run, args=(batch,), daemon=True).start()
+        return future
+    
+    def _take_pending(self) -> list:
+        """Detach the pending batch (caller holds the lock)"""
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+    
+    def _flush(self):
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._run(batch)
+    
+    def _run(self, batch: list):
+        if len(batch) == 1:
+            # Nothing to coalesce - the caller makes its regular request
+            batch[0][1].set_result(None)
+            return
+        
+        try:
+            results = self._generate_batch([request for request, _ in batch])
+        except Exception as e:
+            logger.warning(f"Batched SOAP generation failed, falling back to individual calls: {e}")
+            results = [None] * len(batch)
+        
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
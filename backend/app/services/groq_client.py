@@ -0,0 +1,59 @@
+"""
+Groq Client
+Shared AsyncGroq client and in-flight request limit for the Groq SOAP services
+"""
+
+import importlib.util
+import logging
+from typing import TYPE_CHECKING
+
+from app.config import settings
+from app.services.loop_clients import get_loop_client
+from app.services.slots import SlotPool
+
+# groq (and httpx/pydantic under it) is imported on first use, not at module import
+if TYPE_CHECKING:
+    import groq
+
+logger = logging.getLogger(__name__)
+
+# Optional: h2 enables HTTP/2 (one multiplexed connection for hedged/concurrent calls)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+if not HTTP2_AVAILABLE:
+    logger.info("h2 not available. Groq client uses HTTP/1.1.")
+
+# Process-wide cap on in-flight Groq requests: consultations run on their own event
+# loops, so an asyncio.Semaphore would only cap the requests of one consultation
+_inflight = SlotPool(settings.GROQ_CONCURRENCY)
+
+
+def _create_client() -> "groq.AsyncGroq":
+    import groq
+    import httpx
+    
+    http_client = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+    )
+    return groq.AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        timeout=httpx.Timeout(30.0, connect=2.0),
+        http_client=http_client
+    )
+
+
+def get_groq_client() -> "groq.AsyncGroq":
+    """AsyncGroq client shared by all requests on the running event loop (closed with the loop)"""
+    # The httpx connection pool is bound to the loop it is used on
+    return get_loop_client("groq", _create_client, lambda client: client.close())
+
+
+def groq_slot():
+    """Hold one of the process-wide in-flight Groq request slots for the block (async with)"""
+    return _inflight.slot()
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an exception is a Groq 429 (rate limit) error"""
+    import groq
+    return isinstance(error, groq.RateLimitError)
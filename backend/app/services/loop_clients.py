@@ -0,0 +1,41 @@
+"""
+Per-Loop Clients
+Async SDK clients shared by all requests on one event loop, closed with the loop
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Background consultations each run on their own short-lived event loop, and an async
+# client's connection pool is bound to the loop it was first used on - so clients are
+# kept per loop and closed by aclose_loop_clients() before the loop is closed
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[Any, Callable[[Any], Awaitable[None]]]]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_loop_client(name: str, factory: Callable[[], Any], aclose: Callable[[Any], Awaitable[None]]) -> Any:
+    """Client `name` for the running event loop, created with factory() on first use"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_clients = _clients.setdefault(loop, {})
+        entry = loop_clients.get(name)
+        if entry is None:
+            entry = (factory(), aclose)
+            loop_clients[name] = entry
+    return entry[0]
+
+
+async def aclose_loop_clients() -> None:
+    """Close every client created on the running event loop (call before closing the loop)"""
+    with _clients_lock:
+        loop_clients = _clients.pop(asyncio.get_running_loop(), {})
+    for name, (client, aclose) in loop_clients.items():
+        try:
+            await aclose(client)
+        except Exception as e:
+            logger.warning(f"Failed to close {name} client: {e}")
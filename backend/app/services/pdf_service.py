@@ -5,11 +5,39 @@ Generates PDF documents from SOAP notes
 
 import logging
 import os
-from io import BytesIO
+import re
+from io import BytesIO, StringIO
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Runs of two or more newlines collapse to a single paragraph break in reportlab markup
+_NL_MULTI = re.compile(r'\n{2,}')
+
+# Separators between inline bullet items: a dash followed by a space ("fever - cough",
+# "fever- cough") or a period followed by a dash ("fever. - cough", "fever.-cough")
+_BULLET_SEP = re.compile(r'\s*-\s+|\s*\.\s*-\s*')
+# str.translate table deleting the Tamil Unicode block (0B80-0BFF)
+_TAMIL_KILL_TABLE = dict.fromkeys(range(0x0B80, 0x0C00))
+
+
+def _join_sections(sections: list) -> str:
+    """Join markdown sections with blank lines into one growable buffer"""
+    buf = StringIO()
+    for i, section in enumerate(sections):
+        if i:
+            buf.write("\n\n")
+        buf.write(section)
+    return buf.getvalue()
+
+
+def _is_already_normalized(markdown: str) -> bool:
+    """Check whether markdown already uses only '## ' headers and '- '/'• ' bullets"""
+    return all(
+        not line.strip() or line.startswith(("## ", "- ", "• "))
+        for line in markdown.split("\n")
+    )
+
 # Set library paths for WeasyPrint (macOS)
 # These need to be set before importing weasyprint
 if 'DYLD_LIBRARY_PATH' not in os.environ:
@@ -659,10 +687,8 @@ class PDFService:
         
         logger.debug(f"Converting to bullet points: {text[:100]}...")
         
-        # Split by " - " or " -" or "- " to handle various formats
-        import re
         # Split by common separators (dash with spaces, periods followed by dash, etc.)
-        items = re.split(r'\s*-\s+|\s*\.\s*-\s*', text)
+        items = _BULLET_SEP.split(text)
         
         # Clean up items and filter empty ones
         bullet_items = []
@@ -692,6 +718,10 @@ class PDFService:
         if not markdown:
             return ""
         
+        # LLM output usually follows the prompt format already - nothing to do
+        if _is_already_normalized(markdown):
+            return markdown
+        
         lines = markdown.split("\n")
         result = []
         in_section = False
@@ -832,7 +862,7 @@ class PDFService:
                 else:
                     sections.append("## Subjective\n" + "\n".join(current_content))
         
-        return "\n\n".join(sections)
+        return _join_sections(sections)
     
     def _remove_tamil_text(self, text: str) -> str:
         """
@@ -853,11 +883,11 @@ class PDFService:
         lines = text.split('\n')
         cleaned_lines = []
         for line in lines:
+            # Remove Tamil characters but keep the line structure
+            cleaned_line = line.translate(_TAMIL_KILL_TABLE)
             # Remove lines that are mostly Tamil
-            tamil_chars = sum(1 for c in line if '\u0B80' <= c <= '\u0BFF')
-            if tamil_chars < len(line) * 0.5:  # Keep line if less than 50% Tamil
-                # Remove Tamil characters but keep the line structure
-                cleaned_line = ''.join(c for c in line if not ('\u0B80' <= c <= '\u0BFF'))
+            tamil_chars = len(line) - len(cleaned_line)
+            if tamil_chars * 2 < len(line):  # Keep line if less than 50% Tamil
                 cleaned_lines.append(cleaned_line)
         
         result = '\n'.join(cleaned_lines)
@@ -879,11 +909,8 @@ class PDFService:
                 .replace('"', "&quot;")
         )
         # Convert newlines to <br/> for reportlab
-        # Also handle multiple consecutive newlines
-        escaped = escaped.replace("\n\n\n", "<br/><br/>")
-        escaped = escaped.replace("\n\n", "<br/><br/>")
-        escaped = escaped.replace("\n", "<br/>")
-        return escaped
+        # Multiple consecutive newlines become a single paragraph break
+        return _NL_MULTI.sub("<br/><br/>", escaped).replace("\n", "<br/>")
     
     def _add_soap_note_to_story(self, story, markdown: str, soap_style, normal_style):
         """
@@ -1006,7 +1033,8 @@ class PDFService:
             item_text = item.strip()
             if item_text:
                 # Remove any "bullet" text that might have been added incorrectly
-                item_text = item_text.replace("bullet", "").strip()
+                if "bullet" in item_text:
+                    item_text = item_text.replace("bullet", "").strip()
                 if item_text:
                     # Use Unicode bullet character (•) for reliable rendering
                     bullet_text = f"• {item_text}"
@@ -1088,7 +1116,7 @@ class PDFService:
             else:
                 sections.append(header)
         
-        result = "\n\n".join(sections)
+        result = _join_sections(sections)
         logger.info(f"Reconstructed markdown (first 300 chars): {result[:300]}")
         return result
     
@@ -0,0 +1,167 @@
+"""
+Semantic Cache
+Reuses previously generated SOAP notes for identical and near-duplicate transcripts
+"""
+
+import hashlib
+import importlib.util
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# Optional: sentence-transformers for local transcript embeddings
+# (only probed here - the torch/onnx stack is imported when the model is loaded)
+try:
+    import numpy as np
+    SEMANTIC_CACHE_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+if not SEMANTIC_CACHE_AVAILABLE:
+    logger.info("sentence-transformers not available. Semantic SOAP cache disabled.")
+
+# Dynamically int8-quantized ONNX export shipped in the MiniLM model repo
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+
+def normalize_transcript(transcript: str) -> str:
+    """NFKC-normalize, casefold and collapse whitespace so trivial differences don't miss"""
+    # ASCII text is already NFKC; skip the normalization pass
+    if not transcript.isascii():
+        transcript = unicodedata.normalize("NFKC", transcript)
+    return " ".join(transcript.casefold().split())
+
+
+class ExactCache:
+    """LRU + TTL cache of SOAP results keyed by a hash of (language, transcript)"""
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expiry monotonic time, result)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, transcript: str, language: str) -> str:
+        """BLAKE2b digest of the language and normalized transcript"""
+        return hashlib.blake2b(f"{language}|{normalize_transcript(transcript)}".encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Copy of the cached result, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a result, evicting the least recently used entry beyond max_entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SemanticCache:
+    """In-memory embedding index of SOAP results, bucketed by language"""
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.92,
+        max_entries: int = 1000
+    ):
+        """Load the embedding model (cache stays disabled if unavailable)"""
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model = None
+        # language -> (embedding matrix, results); replaced atomically on add
+        self._buckets: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+        if SEMANTIC_CACHE_AVAILABLE:
+            self.model = self._load_model(model_name)
+
+    def _load_model(self, model_name: str):
+        """Load the embedder, preferring the int8 ONNX Runtime build over FP32 PyTorch"""
+        from sentence_transformers import SentenceTransformer
+        
+        try:
+            model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+            logger.info(f"Semantic cache initialized with {model_name} (ONNX int8)")
+            return model
+        except Exception as e:
+            logger.info(f"ONNX int8 embedding model unavailable, using PyTorch: {e}")
+
+        try:
+            model = SentenceTransformer(model_name)
+            logger.info(f"Semantic cache initialized with {model_name}")
+            return model
+        except Exception as e:
+            logger.warning(f"Failed to load embedding model: {e}")
+            return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    def embed(self, transcript: str):
+        """Compute a unit-length embedding for a transcript"""
+        return self.model.encode(normalize_transcript(transcript), normalize_embeddings=True)
+
+    def embed_batch(self, transcripts: List[str]):
+        """Compute unit-length embeddings for several transcripts in one model call"""
+        return self.model.encode([normalize_transcript(t) for t in transcripts], normalize_embeddings=True)
+
+    def lookup(self, embedding, language: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the closest cached result for this language
+
+        Returns:
+            Copy of the cached result if cosine similarity clears the threshold, else None
+        """
+        bucket = self._buckets.get(language)
+        if not bucket:
+            return None
+
+        embeddings, results = bucket
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        scores = embeddings @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.info(f"Semantic cache hit (similarity {scores[best]:.3f})")
+            return dict(results[best])
+        return None
+
+    def add(self, embedding, language: str, result: Dict[str, Any]) -> None:
+        """Store a generated result, evicting the oldest entries beyond max_entries"""
+        with self._lock:
+            bucket = self._buckets.get(language)
+            if bucket:
+                embeddings = np.vstack([bucket[0], embedding])[-self.max_entries:]
+                results = (bucket[1] + [result])[-self.max_entries:]
+            else:
+                embeddings = np.asarray([embedding])
+                results = [result]
+            self._buckets[language] = (embeddings, results)
+
+
+class ExampleIndex:
+    """Nearest-neighbour lookup over few-shot example transcripts, sharing the semantic cache's embedder"""
+
+    def __init__(self, cache: SemanticCache, transcripts: List[str]):
+        # A few dozen examples - a dense matrix product beats an ANN index at this size
+        self.embeddings = cache.embed_batch(transcripts)
+
+    def nearest(self, embedding) -> int:
+        """Index of the example most similar to the given transcript embedding"""
+        return int(np.argmax(self.embeddings @ embedding))
@@ -0,0 +1,79 @@
+"""
+Upstream Slots
+Process-wide limit on concurrent upstream API calls, shared across event loops
+"""
+
+import asyncio
+import collections
+import contextlib
+import threading
+
+
+class SlotPool:
+    """
+    FIFO counting semaphore usable from any thread's event loop
+
+    Consultations run on separate threads, each with its own event loop, so an
+    asyncio.Semaphore (bound to one loop) can't cap calls across them, and a blocking
+    threading.Semaphore.acquire() would park an executor thread that slot holders need
+    for their own to_thread calls. Waiters instead await a future on their own loop,
+    and a released slot is handed directly to the longest-waiting one.
+    """
+
+    def __init__(self, limit: int):
+        self._free = limit
+        self._waiters: collections.deque = collections.deque()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> int:
+        """Slots not currently held"""
+        with self._lock:
+            return self._free
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one slot for the block"""
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if future in self._waiters:
+                    # Never granted - just leave the queue
+                    self._waiters.remove(future)
+                    raise
+            if not future.cancelled():
+                # Granted just before the cancellation landed - pass the slot on
+                self._release()
+            raise
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                future = self._waiters.popleft()
+                try:
+                    future.get_loop().call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    continue  # The waiter's loop is closed
+            self._free += 1
+
+    def _grant(self, future: asyncio.Future):
+        """Complete a waiter's future on its own loop (or pass the slot on if it was cancelled)"""
+        if future.done():
+            self._release()
+        else:
+            future.set_result(None)
@@ -0,0 +1,37 @@
+"""
+SOAP Sections
+Splits a markdown SOAP note into its sections (shared by the Gemini and Groq services)
+"""
+
+from typing import Dict
+
+# SOAP section keys and their lowercased markdown headers
+_SECTION_HEADERS = (
+    ("subjective", "## subjective"),
+    ("objective", "## objective"),
+    ("assessment", "## assessment"),
+    ("plan", "## plan"),
+)
+
+
+def split_sections(soap_note: str) -> Dict[str, str]:
+    """
+    Map SOAP section keys to their bodies in a markdown note
+
+    Headers match case-insensitively by prefix ("## Subjective (S)" is "subjective"),
+    the first occurrence of a section wins, and missing sections are left out.
+    """
+    sections: Dict[str, str] = {}
+    # Locate each header with str.find (case-insensitive via one lowercased copy)
+    note_lower = soap_note.lower()
+    for section, header in _SECTION_HEADERS:
+        start = note_lower.find(header)
+        if start < 0:
+            continue
+        # Body runs from the line after the header to the next "##" header (or the end)
+        body_start = soap_note.find("\n", start)
+        if body_start < 0:
+            continue
+        body_end = soap_note.find("\n##", body_start)
+        sections[section] = soap_note[body_start + 1:body_end if body_end >= 0 else len(soap_note)].strip()
+    return sections
@@ -4,16 +4,29 @@ Generates structured SOAP notes from transcripts using Google Gemini
 Enhanced with Indian clinical examples and improved prompt engineering
 """
 
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from app.config import settings
+from app.services.batching import BatchQueue
+from app.services.loop_clients import get_loop_client
+from app.services.semantic_cache import ExactCache, SemanticCache, ExampleIndex
+from app.services.soap_sections import split_sections
+from pydantic import BaseModel
+import asyncio
+import difflib
+import functools
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Iterator, Tuple, TYPE_CHECKING
 import json
+import orjson
 import re
 import os
+import threading
+import time
 from pathlib import Path
 
+# The Gemini SDK is heavy to import; it is loaded when the service is first constructed
+if TYPE_CHECKING:
+    from google.genai import types
+
 logger = logging.getLogger(__name__)
 
 # Optional: Hugging Face NER for entity validation (Phase 1)
@@ -26,179 +39,84 @@ logger = logging.getLogger(__name__)
 #     logger.info("Hugging Face transformers not available. NER validation disabled.")
 NER_AVAILABLE = False  # Set to True when ready to integrate
 
-class SOAPGenerationService:
-    """Service for generating SOAP notes using Google Gemini - Phase 1 Enhanced"""
-    
-    def __init__(self):
-        """Initialize Gemini client and load Indian clinical examples"""
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # Use Gemini 2.0 Flash for medical documentation (best balance of speed and quality)
-        # Alternative: models/gemini-2.5-flash for latest version
-        self.model = genai.GenerativeModel(
-            model_name="models/gemini-2.0-flash",
-            generation_config={
-                "temperature": 0.1,  # Medical precision
-                "top_p": 0.8,
-                "max_output_tokens": 4000,
-            },
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
-        )
-        
-        # Load Indian clinical examples for few-shot learning
-        self.examples = self._load_indian_examples()
-        
-        # Initialize NER models if available (Phase 1 - optional)
-        self.medical_ner = None
-        if NER_AVAILABLE:
-            try:
-                self.medical_ner = pipeline(
-                    "ner",
-                    model="AventIQ-AI/bert-medical-entity-extraction",
-                    aggregation_strategy="simple"
-                )
-                logger.info("Medical NER model loaded successfully")
-            except Exception as e:
-                logger.warning(f"Failed to load NER model: {e}")
-                self.medical_ner = None
-    
-    async def generate_soap_note(
-        self,
-        transcript: str,
-        language: str,
-        patient_name: Optional[str] = None,
-        doctor_text: Optional[str] = None,
-        patient_text: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """
-        Generate structured SOAP note from transcript using Gemini
-        
-        Args:
-            transcript: Full transcript text
-            language: Language code ("ta" for Tamil, "te" for Telugu)
-            patient_name: Patient name (optional)
-            doctor_text: Doctor's speech only (if diarization available)
-            patient_text: Patient's speech only (if diarization available)
-        
-        Returns:
-            Dictionary with SOAP note and extracted entities
-        """
-        try:
-            # Build context
-            if doctor_text and patient_text:
-                context = f"""**Doctor's Speech:**
-{doctor_text}
+# Optional: pyahocorasick for single-pass symptom and condition keyword matching
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    logger.info("pyahocorasick not available. Using substring scans for keyword detection.")
 
-**Patient's Speech:**
-{patient_text}
-"""
-            else:
-                context = f"**Full Transcript:**\n{transcript}"
-            
-            lang_name = "Tamil" if language == "ta" else "Telugu"
-            
-            # Create professional medical scribe prompt
-            prompt = self._create_professional_prompt(transcript, language, lang_name, context)
-            
-            # Call Gemini API
-            response = self.model.generate_content(prompt)
-            
-            # Parse response
-            content = response.text
-            
-            # Try to parse JSON
-            try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
-                # Fallback: Try to extract JSON from markdown code blocks
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(1))
-                else:
-                    # Last resort: Create basic structure from text
-                    logger.warning("Failed to parse JSON, creating fallback structure")
-                    result = {
-                        "soap_note": content,
-                        "subjective": "",
-                        "objective": "",
-                        "assessment": "",
-                        "plan": "",
-                        "entities": {
-                            "symptoms": [],
-                            "medications": [],
-                            "diagnoses": [],
-                            "vitals": {}
-                        },
-                        "icd_codes": []
-                    }
-            
-            # Ensure all required fields exist
-            soap_note = result.get("soap_note", "")
-            entities = result.get("entities", {})
-            icd_codes = result.get("icd_codes", [])
-            
-            # Extract structured sections if not provided
-            if not result.get("subjective"):
-                subjective_match = re.search(r'## Subjective\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["subjective"] = subjective_match.group(1).strip() if subjective_match else ""
-            
-            if not result.get("objective"):
-                objective_match = re.search(r'## Objective\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["objective"] = objective_match.group(1).strip() if objective_match else ""
-            
-            if not result.get("assessment"):
-                # Try multiple patterns to extract Assessment
-                assessment_match = re.search(r'## Assessment\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                if not assessment_match:
-                    assessment_match = re.search(r'Assessment[:\-]?\s*\n(.*?)(?=\nPlan|$)', soap_note, re.DOTALL | re.IGNORECASE)
-                result["assessment"] = assessment_match.group(1).strip() if assessment_match else "Clinical assessment pending further evaluation"
-            
-            if not result.get("plan"):
-                # Try multiple patterns to extract Plan
-                plan_match = re.search(r'## Plan\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                if not plan_match:
-                    plan_match = re.search(r'Plan[:\-]?\s*\n(.*?)$', soap_note, re.DOTALL | re.IGNORECASE)
-                result["plan"] = plan_match.group(1).strip() if plan_match else "Symptomatic management and follow-up recommended"
-            
-            logger.info(f"SOAP note generated: {len(soap_note)} characters")
-            
-            # Ensure Assessment and Plan are never empty
-            assessment = result.get("assessment", "").strip()
-            plan = result.get("plan", "").strip()
-            
-            # Log if Assessment or Plan are missing for debugging
-            if not assessment:
-                logger.warning("Assessment section missing from LLM response, using fallback")
-                assessment = "Clinical assessment pending further evaluation"
-            if not plan:
-                logger.warning("Plan section missing from LLM response, using fallback")
-                plan = "Symptomatic management and follow-up recommended"
-            
-            logger.info(f"SOAP sections - Subjective: {bool(result.get('subjective'))}, Objective: {bool(result.get('objective'))}, Assessment: {bool(assessment)}, Plan: {bool(plan)}")
-            
-            return {
-                "soap_note": soap_note,
-                "subjective": result.get("subjective", ""),
-                "objective": result.get("objective", ""),
-                "assessment": assessment,
-                "plan": plan,
-                "entities": entities,
-                "icd_codes": icd_codes,
-                "success": True
-            }
-            
-        except Exception as e:
-            logger.error(f"SOAP generation failed: {e}", exc_info=True)
-            raise Exception(f"SOAP generation failed: {str(e)}")
+# Optional: ijson for incremental parsing of the streamed JSON response
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+    logger.info("ijson not available. Streamed SOAP sections are parsed once the response completes.")
+
+# Lifetime of the Gemini context cache holding the system prompt + examples
+PROMPT_CACHE_TTL_SECONDS = 3600
+
+# Explicit context caching rejects prefixes below the model's minimum (gemini-2.0-flash);
+# prefix size is estimated locally (~4 chars per token) so small prefixes skip the round trip
+PROMPT_CACHE_MIN_TOKENS = 4096
+_CHARS_PER_TOKEN = 4
+
+# Combined transcript length allowed in one concatenated batch call (~28k input tokens for Indic scripts)
+_BATCH_MAX_INPUT_CHARS = 28_000
+
+# Output token budget: scaled to transcript length, retried at the full cap if truncated
+MAX_OUTPUT_TOKENS = 4000
+MIN_OUTPUT_TOKENS = 800
+
+# Doctor edits collected for fine-tuning, one JSON object per line
+_FEEDBACK_FILE = Path(__file__).parent.parent.parent / "data" / "doctor_feedback.jsonl"
+
+# Fallbacks for sections the model left empty
+_DEFAULT_ASSESSMENT = "Clinical assessment pending further evaluation"
+_DEFAULT_PLAN = "Symptomatic management and follow-up recommended"
+
+# Symptom keywords used to pick physical exam guidance
+_SYMPTOM_KEYWORDS = (
+    'fever', 'cough', 'pain', 'headache', 'abdominal', 'chest', 'breathing',
+    'throat', 'stomach', 'nausea', 'vomiting', 'diarrhea', 'dizziness',
+    'weakness', 'joint', 'muscle', 'back'
+)
+
+# All symptom keywords as one alternation - a single scan when the automaton isn't used
+_SYMPTOM_RE = re.compile("|".join(map(re.escape, _SYMPTOM_KEYWORDS)))
+
+# Below this length the regex scan beats walking the automaton
+_AHOCORASICK_MIN_LENGTH = 200
+
+# Condition types in priority order, with the keywords that indicate them
+_CONDITION_KEYWORDS = (
+    ("respiratory", ("fever", "cough", "cold", "respiratory", "throat", "nasal")),
+    ("gastrointestinal", ("abdominal", "stomach", "gastritis", "vomiting", "diarrhea")),
+    ("cardiovascular", ("chest pain", "hypertension", "heart", "bp", "blood pressure")),
+    ("neurological", ("headache", "dizziness", "seizure", "neurological")),
+    ("endocrine", ("diabetes", "sugar", "fbs", "diabetic")),
+)
+
+_SYMPTOM_AUTOMATON = None
+_CONDITION_AUTOMATON = None
+if AHOCORASICK_AVAILABLE:
+    _SYMPTOM_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in _SYMPTOM_KEYWORDS:
+        _SYMPTOM_AUTOMATON.add_word(_keyword, _keyword)
+    _SYMPTOM_AUTOMATON.make_automaton()
     
-    def _get_system_prompt(self) -> str:
-        """Professional medical scribe system prompt"""
-        return """You are an expert medical scribe AI assistant specializing in converting doctor-patient consultations into professional, structured SOAP (Subjective, Objective, Assessment, Plan) notes.
+    # Values are (priority, condition type) so the highest-priority hit wins
+    _CONDITION_AUTOMATON = ahocorasick.Automaton()
+    for _priority, (_condition, _keywords) in enumerate(_CONDITION_KEYWORDS):
+        for _keyword in _keywords:
+            _CONDITION_AUTOMATON.add_word(_keyword, (_priority, _condition))
+    _CONDITION_AUTOMATON.make_automaton()
+
+
+# Professional medical scribe system prompt
+_SYSTEM_PROMPT = """You are an expert medical scribe AI assistant specializing in converting doctor-patient consultations into professional, structured SOAP (Subjective, Objective, Assessment, Plan) notes.
 
 Your expertise:
 - Professional medical documentation following clinical standards
@@ -218,47 +136,16 @@ Documentation standards:
 - Auto-generate ICD-10 codes for diagnoses
 
 CRITICAL: All SOAP note content must be in English only. Translate all Tamil/Telugu terms to English. Do NOT include Tamil/Telugu text or terms in brackets."""
-    
-    def _classify_condition_type(self, transcript: str) -> Optional[str]:
-        """Classify condition type from transcript for better example selection"""
-        transcript_lower = transcript.lower()
-        
-        if any(term in transcript_lower for term in ["fever", "cough", "cold", "respiratory", "throat", "nasal"]):
-            return "respiratory"
-        elif any(term in transcript_lower for term in ["abdominal", "stomach", "gastritis", "vomiting", "diarrhea"]):
-            return "gastrointestinal"
-        elif any(term in transcript_lower for term in ["chest pain", "hypertension", "heart", "bp", "blood pressure"]):
-            return "cardiovascular"
-        elif any(term in transcript_lower for term in ["headache", "dizziness", "seizure", "neurological"]):
-            return "neurological"
-        elif any(term in transcript_lower for term in ["diabetes", "sugar", "fbs", "diabetic"]):
-            return "endocrine"
-        else:
-            return None
-    
-    def _create_professional_prompt(self, transcript: str, language: str, lang_name: str, context: str) -> str:
-        """Create professional medical scribe prompt with Indian examples - Phase 1 Enhanced"""
-        
-        # Classify condition type for better example selection
-        condition_type = self._classify_condition_type(transcript)
-        examples = self._get_professional_examples(condition_type)
-        
-        # Extract symptoms from transcript for inference (simple keyword matching)
-        symptom_keywords = ['fever', 'cough', 'pain', 'headache', 'abdominal', 'chest', 'breathing', 
-                           'throat', 'stomach', 'nausea', 'vomiting', 'diarrhea', 'dizziness', 
-                           'weakness', 'joint', 'muscle', 'back']
-        detected_symptoms = [kw for kw in symptom_keywords if kw.lower() in transcript.lower()]
-        exam_template = self._get_physical_exam_template(detected_symptoms) if detected_symptoms else ""
-        
-        prompt = f"""Convert this {lang_name} doctor-patient consultation transcript into a professional, structured SOAP medical note in English only.
 
-Translate all medical terms, symptoms, and medications from {lang_name} to English. Do NOT include {lang_name} text or terms in brackets.
 
-{examples}
+# Prompt segments - only the language name, examples, context and exam template vary per call
+_PROMPT_HEAD = """Convert this {lang_name} doctor-patient consultation transcript into a professional, structured SOAP medical note in English only.
 
-**Current Consultation:**
+Translate all medical terms, symptoms, and medications from {lang_name} to English. Do NOT include {lang_name} text or terms in brackets.
 
-{context}
+"""
+_PROMPT_CONSULTATION_HEADER = '\n\n**Current Consultation:**\n\n'
+_PROMPT_INSTRUCTIONS = """
 
 **Instructions:**
 
@@ -278,7 +165,16 @@ Translate all medical terms, symptoms, and medications from {lang_name} to Engli
      * Abdominal pain → Document: "Abdominal examination: [infer based on symptoms]"
      * Headache → Document: "Neurological examination: [infer basic findings]"
    - **Structured Physical Exam Template:** Use this as guidance for common examinations:
-{exam_template if exam_template else "     * General appearance, vital signs, and system-specific examinations based on symptoms"}
+"""
+_DEFAULT_EXAM_LINE = "     * General appearance, vital signs, and system-specific examinations based on symptoms"
+_BATCH_PROMPT_HEAD = """Convert each of the following {count} doctor-patient consultation transcripts (Tamil or Telugu) into a professional, structured SOAP medical note in English only.
+
+Process each consultation independently. Return a JSON array containing exactly {count} SOAP note objects, one per consultation, in the same order as the consultations below.
+
+Translate all medical terms, symptoms, and medications to English. Do NOT include Tamil/Telugu text or terms in brackets.
+
+"""
+_PROMPT_TAIL = """
    - **If NO objective findings mentioned:** Write: "Objective findings: Not documented in consultation. Clinical examination recommended."
    - **DO NOT leave empty.** Always provide meaningful objective documentation.
    - Output ONLY in English.
@@ -294,20 +190,20 @@ IMPORTANT: All output must be in English only. Do NOT include Tamil/Telugu terms
 Keep each section concise but complete. Use bullet points in markdown format.
 
 **Output Format (JSON):**
-{{
+{
   "soap_note": "## Subjective\\n- Chief complaint with duration (English only)\\n\\n## Objective\\n- Vital signs and examination findings (English only)\\n\\n## Assessment\\n- Primary diagnosis (English only)\\n\\n## Plan\\n- Medication name with dosage, frequency, duration (English only)\\n- Follow-up instructions",
   "subjective": "Extracted subjective information in English",
   "objective": "All objective findings including vitals, physical examination, and diagnostic tests in English. Use inference for common examinations based on symptoms. If none mentioned, state 'Objective findings: Not documented in consultation. Clinical examination recommended.'",
   "assessment": "Clinical assessment/diagnosis in English",
   "plan": "Complete treatment plan with medications and follow-up in English",
-  "entities": {{
+  "entities": {
     "symptoms": ["symptom1", "symptom2"],
     "medications": ["medication1 dosage frequency", "medication2 dosage frequency"],
     "diagnoses": ["diagnosis1", "diagnosis2"],
-    "vitals": {{"bp": "120/80", "pulse": "72", "temp": "98.6"}}
-  }},
+    "vitals": {"bp": "120/80", "pulse": "72", "temp": "98.6"}
+  },
   "icd_codes": ["A00.0", "B00.0"]
-}}
+}
 
 CRITICAL REQUIREMENTS:
 1. All text in soap_note, subjective, objective, assessment, and plan must be in English only. No Tamil/Telugu text or brackets.
@@ -315,69 +211,778 @@ CRITICAL REQUIREMENTS:
 3. You MUST provide values for assessment and plan fields in the JSON response.
 4. If assessment is unclear, use: "Clinical assessment pending further evaluation" or "Symptomatic treatment indicated"
 5. If plan is unclear, use: "Symptomatic management recommended" or "Supportive care and follow-up advised"
-6. DO NOT leave assessment or plan empty. Always provide meaningful clinical content.
+6. DO NOT leave assessment or plan empty. Always provide meaningful clinical content."""
+
+
+# Few-shot example used when no Indian clinical examples are available
+_DEFAULT_EXAMPLE = """**Example:**
+
+Transcript: "Patient has fever and cough for 3 days. BP 130/85. Prescribe Paracetamol 650mg three times daily."
+
+Output JSON:
+{
+  "soap_note": "## Subjective\\n- Fever for 3 days\\n- Cough for 3 days\\n\\n## Objective\\n- Vital Signs: Blood Pressure 130/85 mmHg, Pulse regular\\n- General Appearance: Alert, comfortable\\n- Respiratory Examination: Mild tachypnea noted, no obvious respiratory distress\\n- Throat Examination: Mild erythema noted (inferred from symptoms)\\n\\n## Assessment\\n- Acute pharyngitis\\n\\n## Plan\\n- Paracetamol 650mg - Three times daily (TID) for 3 days\\n- Rest and adequate fluid intake\\n- Follow-up in 3 days if symptoms persist",
+  "subjective": "Fever and cough for 3 days",
+  "objective": "Vital Signs: BP 130/85 mmHg. General: Alert. Respiratory: Mild tachypnea. Throat: Mild erythema (inferred).",
+  "assessment": "Acute pharyngitis",
+  "plan": "Paracetamol 650mg TID for 3 days, rest, fluids, follow-up in 3 days",
+  "entities": {"symptoms": ["Fever", "Cough"], "medications": ["Paracetamol 650mg"], "diagnoses": ["Acute pharyngitis"], "vitals": {"bp": "130/85"}},
+  "icd_codes": ["J02.0"]
+}"""
+
+
+@functools.cache
+def _load_indian_examples() -> List[Dict]:
+    """Load validated Indian clinical examples from JSON file (parsed once per process)"""
+    examples_file = Path(__file__).parent.parent.parent / "data" / "indian_clinical_examples.json"
+    
+    try:
+        if examples_file.exists():
+            data = orjson.loads(examples_file.read_bytes())
+            examples = data.get("examples", [])
+            # Filter to validated examples only
+            validated = [ex for ex in examples if ex.get("validated", False)]
+            logger.info(f"Loaded {len(validated)} validated Indian clinical examples")
+            return validated
+        else:
+            logger.warning(f"Examples file not found: {examples_file}. Using default examples.")
+            return []
+    except Exception as e:
+        logger.error(f"Failed to load Indian examples: {e}. Using default examples.")
+        return []
+
+
+@functools.lru_cache(maxsize=64)
+def _prompt_skeleton(lang_name: str, examples: str, symptoms: frozenset) -> Tuple[str, str]:
+    """
+    Static prompt text around the consultation context
+    
+    Returns:
+        Tuple of (text before the context, text after it)
+    """
+    exam_template = _build_physical_exam_template(symptoms) if symptoms else ""
+    prefix = "".join([_PROMPT_HEAD.format(lang_name=lang_name), examples, _PROMPT_CONSULTATION_HEADER])
+    suffix = "".join([_PROMPT_INSTRUCTIONS, exam_template or _DEFAULT_EXAM_LINE, _PROMPT_TAIL])
+    return prefix, suffix
+
+
+@functools.lru_cache(maxsize=128)
+def _build_physical_exam_template(symptoms: frozenset) -> str:
+    """
+    Generate structured physical examination template based on symptoms
+    Helps infer common examinations that should be documented
+    """
+    template_sections = []
+    
+    # Always include general appearance
+    template_sections.append("- General Appearance: Alert, comfortable (if not mentioned, infer from context)")
+    
+    # Infer examinations based on symptoms (keywords are already lowercase)
+    if any(s in symptoms for s in ['fever', 'cough', 'breathing', 'chest', 'throat', 'cold']):
+        template_sections.append("- Respiratory Examination: Assess breath sounds, respiratory rate, chest expansion")
+        template_sections.append("- Throat Examination: Inspect for erythema, exudate, or other findings")
+    
+    if any(s in symptoms for s in ['abdominal', 'stomach', 'pain', 'nausea', 'vomiting', 'diarrhea']):
+        template_sections.append("- Abdominal Examination: Inspect, auscultate, palpate, percuss abdomen")
+        template_sections.append("- Assess for tenderness, distension, organomegaly, bowel sounds")
+    
+    if any(s in symptoms for s in ['headache', 'dizziness', 'seizure', 'weakness', 'numbness']):
+        template_sections.append("- Neurological Examination: Mental status, cranial nerves, motor/sensory function")
+        template_sections.append("- Assess reflexes, coordination, gait if relevant")
+    
+    if any(s in symptoms for s in ['chest pain', 'heart', 'palpitation', 'shortness']):
+        template_sections.append("- Cardiovascular Examination: Heart sounds, rhythm, peripheral pulses")
+        template_sections.append("- Assess for murmurs, gallops, or other abnormal findings")
+    
+    if any(s in symptoms for s in ['joint', 'muscle', 'back', 'limb']):
+        template_sections.append("- Musculoskeletal Examination: Inspect affected area, assess range of motion")
+        template_sections.append("- Palpate for tenderness, swelling, or deformity")
+    
+    return "\n".join(template_sections)
+
+
+# Structured output schema for Gemini (no default values - the Gemini API rejects them)
+class SOAPVitals(BaseModel):
+    """Vital signs mentioned in the consultation"""
+    bp: Optional[str]
+    pulse: Optional[str]
+    temp: Optional[str]
+    respiratory_rate: Optional[str]
+    spo2: Optional[str]
+    weight: Optional[str]
+    height: Optional[str]
+
 
-Output ONLY valid JSON, no additional text."""
+class SOAPEntities(BaseModel):
+    """Medical entities extracted from the consultation"""
+    symptoms: List[str]
+    medications: List[str]
+    diagnoses: List[str]
+    vitals: SOAPVitals
+
+
+class SOAPResponse(BaseModel):
+    """SOAP note response returned by Gemini"""
+    soap_note: str
+    subjective: str
+    objective: str
+    assessment: str
+    plan: str
+    entities: SOAPEntities
+    icd_codes: List[str]
+
+
+class SOAPGenerationService:
+    """Service for generating SOAP notes using Google Gemini - Phase 1 Enhanced"""
+    
+    __slots__ = (
+        "client",
+        "model_name",
+        "generation_config",
+        "examples",
+        "_examples_text",
+        "_prompt_caches",
+        "_batch_queue",
+        "_batch_config",
+        "exact_cache",
+        "semantic_cache",
+        "example_index",
+        "medical_ner",
+    )
+    
+    def __init__(self):
+        """Initialize Gemini client and load Indian clinical examples"""
+        from google import genai
+        from google.genai import types
+        
+        # Sync client for batch calls; async calls go through _aio() (one client per event loop)
+        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        
+        # Use Gemini 2.0 Flash for medical documentation (best balance of speed and quality)
+        # Alternative: gemini-2.5-flash for latest version
+        self.model_name = "gemini-2.0-flash"
+        self.generation_config = types.GenerateContentConfig(
+            temperature=0.1,  # Medical precision
+            top_p=0.8,
+            max_output_tokens=MAX_OUTPUT_TOKENS,
+            system_instruction=self._get_system_prompt(),
+            # Structured output guarantees the response is valid JSON in this shape
+            response_mime_type="application/json",
+            response_schema=SOAPResponse,
+            safety_settings=[
+                types.SafetySetting(category=category, threshold=types.HarmBlockThreshold.BLOCK_NONE)
+                for category in (
+                    types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                    types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                    types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+                    types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+                )
+            ],
+        )
+        
+        # Load Indian clinical examples for few-shot learning
+        self.examples = _load_indian_examples()
+        # Rendered few-shot text per example key (condition type, or ("nearest", index)),
+        # built once so every prompt prefix is byte-identical and read-only across threads
+        self._examples_text: Dict[Any, str] = self._render_all_examples()
+        
+        # Gemini context caches of the static prompt prefix, per example key
+        # example key -> (cache name or None if caching failed, expiry monotonic time)
+        self._prompt_caches: Dict[Any, tuple] = {}
         
-        return prompt
+        # Several consultations per Gemini call (micro-batching and concatenated batches)
+        self._batch_config = self.generation_config.model_copy(
+            update={"response_schema": List[SOAPResponse], "max_output_tokens": 8192}
+        )
+        
+        # Optional micro-batching of concurrent requests into one Gemini call
+        self._batch_queue = None
+        if settings.SOAP_BATCHING_ENABLED:
+            self._batch_queue = BatchQueue(
+                self._generate_batch,
+                max_batch_size=settings.SOAP_BATCH_SIZE,
+                window_seconds=settings.SOAP_BATCH_WINDOW_MS / 1000
+            )
+        
+        # Exact-match cache (identical transcripts replayed during review/edit)
+        self.exact_cache = ExactCache()
+        
+        # Semantic cache for near-duplicate transcripts
+        self.semantic_cache = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.semantic_cache = SemanticCache(threshold=settings.SEMANTIC_CACHE_THRESHOLD)
+        
+        # Nearest-neighbour few-shot selection reuses the semantic cache's embeddings
+        self.example_index = None
+        if self.semantic_cache and self.semantic_cache.enabled and self.examples:
+            try:
+                self.example_index = ExampleIndex(
+                    self.semantic_cache,
+                    [ex.get("transcript_english") or ex.get("transcript", "") for ex in self.examples]
+                )
+            except Exception as e:
+                logger.warning(f"Failed to index clinical examples: {e}")
+        
+        # Initialize NER models if available (Phase 1 - optional)
+        self.medical_ner = None
+        if NER_AVAILABLE:
+            try:
+                self.medical_ner = pipeline(
+                    "ner",
+                    model="AventIQ-AI/bert-medical-entity-extraction",
+                    aggregation_strategy="simple"
+                )
+                logger.info("Medical NER model loaded successfully")
+            except Exception as e:
+                logger.warning(f"Failed to load NER model: {e}")
+                self.medical_ner = None
     
-    def _get_physical_exam_template(self, symptoms: list) -> str:
+    async def generate_soap_note(
+        self,
+        transcript: str,
+        language: str,
+        patient_name: Optional[str] = None,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Generate structured physical examination template based on symptoms
-        Helps infer common examinations that should be documented
+        Generate structured SOAP note from transcript using Gemini
+        
+        Args:
+            transcript: Full transcript text
+            language: Language code ("ta" for Tamil, "te" for Telugu)
+            patient_name: Patient name (optional)
+            doctor_text: Doctor's speech only (if diarization available)
+            patient_text: Patient's speech only (if diarization available)
+        
+        Returns:
+            Dictionary with SOAP note and extracted entities
+            ("cached": True when served from the exact or semantic cache)
         """
-        template_sections = []
+        try:
+            # Identical transcripts skip both the embedding model and Gemini
+            cache_key = self._cache_key(transcript, language, doctor_text, patient_text)
+            cached = self.exact_cache.get(cache_key)
+            if cached:
+                cached["cached"] = True
+                return cached
+            
+            # Reuse a previously generated note for near-duplicate transcripts
+            embedding = None
+            if self.semantic_cache and self.semantic_cache.enabled:
+                # Embedding is CPU-bound model inference - keep it off the event loop
+                embedding = await asyncio.to_thread(self.semantic_cache.embed, transcript)
+                cached = self.semantic_cache.lookup(embedding, language)
+                if cached:
+                    self.exact_cache.set(cache_key, cached)
+                    return dict(cached, cached=True)
+            
+            result = None
+            if self._batch_queue is not None:
+                # Share one Gemini call with other consultations arriving in the same window
+                future = self._batch_queue.enqueue((transcript, language, doctor_text, patient_text))
+                result = await asyncio.wrap_future(future)
+            
+            if result is None:
+                prompt, config = await self._prepare_request(
+                    transcript, language, doctor_text, patient_text, embedding
+                )
+                
+                # Short consultations get a smaller output cap, bounding worst-case latency
+                out_cap = min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, len(transcript) // 2))
+                if out_cap < MAX_OUTPUT_TOKENS:
+                    config = config.model_copy(update={"max_output_tokens": out_cap})
+                
+                # Call Gemini API (streamed, so the event loop stays free while tokens arrive)
+                content, truncated = await self._collect_content(prompt, config)
+                if truncated and out_cap < MAX_OUTPUT_TOKENS:
+                    logger.info(f"SOAP note hit the {out_cap}-token output cap, retrying with {MAX_OUTPUT_TOKENS}")
+                    config = config.model_copy(update={"max_output_tokens": MAX_OUTPUT_TOKENS})
+                    content, _ = await self._collect_content(prompt, config)
+                
+                # Response schema guarantees plain JSON (no markdown fences or free text)
+                result = orjson.loads(content)
+            
+            soap_result = self._finalize_result(result)
+            
+            self.exact_cache.set(cache_key, soap_result)
+            if embedding is not None:
+                self.semantic_cache.add(embedding, language, soap_result)
+            
+            return soap_result
+            
+        except Exception as e:
+            logger.error(f"SOAP generation failed: {e}", exc_info=True)
+            raise Exception(f"SOAP generation failed: {str(e)}")
+    
+    def _cache_key(self, transcript: str, language: str, doctor_text: Optional[str], patient_text: Optional[str]) -> str:
+        """Exact-cache key over everything that reaches the prompt (patient_name doesn't)"""
+        return self.exact_cache.key(f"{transcript}|{doctor_text or ''}|{patient_text or ''}", language)
+    
+    @staticmethod
+    def _finalize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in missing sections of a parsed Gemini response and build the service result"""
+        # Each field is read once; the schema guarantees the keys, defaults cover batch/legacy shapes
+        soap_note = result.get("soap_note", "")
+        subjective = result.get("subjective", "")
+        objective = result.get("objective", "")
+        assessment = result.get("assessment", "").strip()
+        plan = result.get("plan", "").strip()
+        
+        # The schema can't force non-empty strings - backfill sections from the markdown note
+        if not (subjective and objective and assessment and plan):
+            sections = split_sections(soap_note)
+            subjective = subjective or sections.get("subjective", "")
+            objective = objective or sections.get("objective", "")
+            assessment = assessment or sections.get("assessment", "")
+            plan = plan or sections.get("plan", "")
         
-        # Always include general appearance
-        template_sections.append("- General Appearance: Alert, comfortable (if not mentioned, infer from context)")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"SOAP note generated: {len(soap_note)} characters")
         
-        # Infer examinations based on symptoms
-        symptoms_lower = [s.lower() for s in symptoms]
+        # Ensure Assessment and Plan are never empty
+        if not assessment:
+            logger.warning("Assessment section missing from LLM response, using fallback")
+            assessment = _DEFAULT_ASSESSMENT
+        if not plan:
+            logger.warning("Plan section missing from LLM response, using fallback")
+            plan = _DEFAULT_PLAN
         
-        if any(s in symptoms_lower for s in ['fever', 'cough', 'breathing', 'chest', 'throat', 'cold']):
-            template_sections.append("- Respiratory Examination: Assess breath sounds, respiratory rate, chest expansion")
-            template_sections.append("- Throat Examination: Inspect for erythema, exudate, or other findings")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"SOAP sections - Subjective: {bool(subjective)}, Objective: {bool(objective)}, Assessment: {bool(assessment)}, Plan: {bool(plan)}")
         
-        if any(s in symptoms_lower for s in ['abdominal', 'stomach', 'pain', 'nausea', 'vomiting', 'diarrhea']):
-            template_sections.append("- Abdominal Examination: Inspect, auscultate, palpate, percuss abdomen")
-            template_sections.append("- Assess for tenderness, distension, organomegaly, bowel sounds")
+        return {
+            "soap_note": soap_note,
+            "subjective": subjective,
+            "objective": objective,
+            "assessment": assessment,
+            "plan": plan,
+            "entities": result.get("entities", {}),
+            "icd_codes": result.get("icd_codes", []),
+            "success": True
+        }
+    
+    async def generate_soap_notes_batch(
+        self,
+        items: List[Dict[str, Any]],
+        max_concurrency: int = 8
+    ) -> List[Any]:
+        """
+        Generate SOAP notes for several consultations concurrently (e.g. end-of-day processing)
         
-        if any(s in symptoms_lower for s in ['headache', 'dizziness', 'seizure', 'weakness', 'numbness']):
-            template_sections.append("- Neurological Examination: Mental status, cranial nerves, motor/sensory function")
-            template_sections.append("- Assess reflexes, coordination, gait if relevant")
+        Args:
+            items: Keyword arguments for generate_soap_note, one dict per consultation
+            max_concurrency: Maximum in-flight Gemini requests, to stay within QPS limits
         
-        if any(s in symptoms_lower for s in ['chest pain', 'heart', 'palpitation', 'shortness']):
-            template_sections.append("- Cardiovascular Examination: Heart sounds, rhythm, peripheral pulses")
-            template_sections.append("- Assess for murmurs, gallops, or other abnormal findings")
+        Returns:
+            Results in input order; a failed consultation yields its Exception instead
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        if any(s in symptoms_lower for s in ['joint', 'muscle', 'back', 'limb']):
-            template_sections.append("- Musculoskeletal Examination: Inspect affected area, assess range of motion")
-            template_sections.append("- Palpate for tenderness, swelling, or deformity")
+        async def generate(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.generate_soap_note(**item)
         
-        return "\n".join(template_sections)
+        return await asyncio.gather(*(generate(item) for item in items), return_exceptions=True)
     
-    def _load_indian_examples(self) -> List[Dict]:
-        """Load Indian clinical examples from JSON file"""
-        examples_file = Path(__file__).parent.parent.parent / "data" / "indian_clinical_examples.json"
+    async def generate_soap_notes_concatenated(
+        self,
+        items: List[Dict[str, Any]],
+        max_per_call: int = 3
+    ) -> List[Any]:
+        """
+        Generate SOAP notes for queued consultations, several per Gemini call
         
-        try:
-            if examples_file.exists():
-                with open(examples_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    examples = data.get("examples", [])
-                    # Filter to validated examples only
-                    validated = [ex for ex in examples if ex.get("validated", False)]
-                    logger.info(f"Loaded {len(validated)} validated Indian clinical examples")
-                    return validated
+        Short consultations are grouped so they share one copy of the instructions
+        and examples and one round trip. Groups that fail, and consultations too long
+        to share a call, fall back to generate_soap_note.
+        
+        Args:
+            items: Keyword arguments for generate_soap_note, one dict per consultation
+            max_per_call: Maximum consultations per Gemini call
+        
+        Returns:
+            Results in input order; a failed consultation yields its Exception instead
+        """
+        # Group consecutive consultations while their combined transcripts stay under the input budget
+        groups: List[List[int]] = []
+        group_chars = 0
+        for i, item in enumerate(items):
+            chars = len(item["transcript"])
+            if groups and len(groups[-1]) < max_per_call and group_chars + chars <= _BATCH_MAX_INPUT_CHARS:
+                groups[-1].append(i)
+                group_chars += chars
             else:
-                logger.warning(f"Examples file not found: {examples_file}. Using default examples.")
-                return []
+                groups.append([i])
+                group_chars = chars
+        
+        results: List[Any] = [None] * len(items)
+        
+        async def generate_group(indices: List[int]) -> None:
+            if len(indices) > 1:
+                requests = [
+                    (items[i]["transcript"], items[i]["language"], items[i].get("doctor_text"), items[i].get("patient_text"))
+                    for i in indices
+                ]
+                try:
+                    response = await self._aio().models.generate_content(
+                        model=self.model_name,
+                        contents=self._build_batch_prompt(requests),
+                        config=self._batch_config
+                    )
+                    for i, result in zip(indices, self._parse_batch_response(response.text, len(indices))):
+                        results[i] = self._finalize_result(result)
+                    return
+                except Exception as e:
+                    logger.warning(f"Concatenated SOAP call failed, generating individually: {e}")
+            
+            for i in indices:
+                try:
+                    results[i] = await self.generate_soap_note(**items[i])
+                except Exception as e:
+                    results[i] = e
+        
+        await asyncio.gather(*(generate_group(indices) for indices in groups))
+        return results
+    
+    async def stream_soap_note(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the raw SOAP note JSON from Gemini as it is generated
+        
+        Yields:
+            Text chunks in arrival order; concatenated they form the full JSON response
+        """
+        prompt, config = await self._prepare_request(transcript, language, doctor_text, patient_text)
+        async for text in self._stream_content(prompt, config):
+            yield text
+    
+    async def stream_soap_sections(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream SOAP note fields as soon as each one is complete
+        
+        Yields:
+            (field name, value) pairs in response order, e.g. ("subjective", "...")
+        """
+        stream = self.stream_soap_note(transcript, language, doctor_text, patient_text)
+        
+        if not IJSON_AVAILABLE:
+            content = "".join([text async for text in stream])
+            for field, value in orjson.loads(content).items():
+                yield field, value
+            return
+        
+        # Push parser: emits each top-level key/value pair once its value is fully received
+        completed = ijson.sendable_list()
+        parser = ijson.kvitems_coro(completed, "")
+        async for text in stream:
+            parser.send(text.encode("utf-8"))
+            for field, value in completed:
+                yield field, value
+            del completed[:]
+        parser.close()
+        for field, value in completed:
+            yield field, value
+    
+    @staticmethod
+    def _aio():
+        """Gemini async client for the running event loop (its connection pool is loop-bound)"""
+        from google import genai
+        return get_loop_client(
+            "gemini",
+            lambda: genai.Client(api_key=settings.GEMINI_API_KEY).aio,
+            lambda aio: aio.aclose()
+        )
+    
+    async def _stream_content(self, prompt: List[str], config: "types.GenerateContentConfig") -> AsyncIterator[str]:
+        """Stream response text from Gemini chunk by chunk"""
+        stream = await self._aio().models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+    
+    async def _collect_content(self, prompt: List[str], config: "types.GenerateContentConfig") -> Tuple[str, bool]:
+        """
+        Stream a complete response from Gemini
+        
+        Returns:
+            Tuple of (response text, whether generation stopped at max_output_tokens)
+        """
+        from google.genai import types
+        
+        parts = []
+        finish_reason = None
+        stream = await self._aio().models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                parts.append(chunk.text)
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason
+        return "".join(parts), finish_reason == types.FinishReason.MAX_TOKENS
+    
+    async def _prepare_request(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None,
+        embedding=None
+    ) -> tuple:
+        """
+        Build the prompt and generation config for a consultation
+        
+        When the static prefix (system prompt + examples) is held in a Gemini
+        context cache, only the per-consultation tail is sent.
+        
+        Args:
+            embedding: Transcript embedding from the semantic cache; when given,
+                the single most similar clinical example is used as the few-shot
+        
+        Returns:
+            Tuple of (prompt parts, generation config)
+        """
+        # Lowercase once; both keyword scans below reuse it
+        transcript_lower = transcript.lower()
+        condition_type = self._classify_condition_type(transcript_lower)
+        detected_symptoms = self._detect_symptoms(transcript_lower)
+        example_key = condition_type
+        if embedding is not None and self.example_index is not None:
+            example_key = ("nearest", self.example_index.nearest(embedding))
+        cached_content = await self._get_cached_prefix(example_key)
+        
+        if cached_content:
+            config = self.generation_config.model_copy(
+                update={"system_instruction": None, "cached_content": cached_content}
+            )
+            examples = ""
+        else:
+            config = self.generation_config
+            examples = self._get_professional_examples(example_key)
+        
+        prompt = self._build_prompt(transcript, language, doctor_text, patient_text, examples, detected_symptoms)
+        return prompt, config
+    
+    def _generate_batch(self, requests: List[tuple]) -> List[Dict[str, Any]]:
+        """
+        Generate SOAP notes for several consultations in one Gemini call
+        
+        Runs on the batch queue's worker thread, so it uses the synchronous client.
+        
+        Args:
+            requests: (transcript, language, doctor_text, patient_text) tuples
+        
+        Returns:
+            Parsed SOAP responses, in request order
+        """
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=self._build_batch_prompt(requests),
+            config=self._batch_config
+        )
+        return self._parse_batch_response(response.text, len(requests))
+    
+    @staticmethod
+    def _parse_batch_response(text: str, count: int) -> List[Dict[str, Any]]:
+        """Parse a batched Gemini response, checking it holds one SOAP note per consultation"""
+        results = orjson.loads(text)
+        if not isinstance(results, list) or len(results) != count:
+            raise ValueError(f"Expected {count} SOAP notes in batch response")
+        
+        logger.info(f"Generated {count} SOAP notes in one batched call")
+        return results
+    
+    def _build_batch_prompt(self, requests: List[tuple]) -> List[str]:
+        """Build one prompt covering several consultations; instructions and examples are shared"""
+        parts = [
+            _BATCH_PROMPT_HEAD.format(count=len(requests)),
+            self._get_professional_examples(None),
+            _PROMPT_INSTRUCTIONS,
+            _DEFAULT_EXAM_LINE,
+            _PROMPT_TAIL,
+        ]
+        for i, (transcript, language, doctor_text, patient_text) in enumerate(requests, 1):
+            lang_name = "Tamil" if language == "ta" else "Telugu"
+            parts.append(f"\n\n**Consultation {i} ({lang_name}):**\n\n")
+            parts.extend(self._build_context(transcript, doctor_text, patient_text))
+            detected_symptoms = self._detect_symptoms(transcript.lower())
+            if detected_symptoms:
+                parts.append("\n\nPhysical exam guidance:\n")
+                parts.append(self._get_physical_exam_template(detected_symptoms))
+        return parts
+    
+    async def _get_cached_prefix(self, example_key: Any) -> Optional[str]:
+        """
+        Get (or create) the Gemini context cache for an example key's prompt prefix
+        
+        Returns:
+            Cache name, or None if context caching is unavailable
+        """
+        from google.genai import types
+        
+        entry = self._prompt_caches.get(example_key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+
+        if entry and entry[0]:
+            # Extend the live cache instead of re-uploading the prefix
+            try:
+                await self._aio().caches.update(
+                    name=entry[0],
+                    config=types.UpdateCachedContentConfig(ttl=f"{PROMPT_CACHE_TTL_SECONDS}s"),
+                )
+                self._prompt_caches[example_key] = (entry[0], time.monotonic() + PROMPT_CACHE_TTL_SECONDS - 60)
+                return entry[0]
+            except Exception as e:
+                logger.warning(f"Failed to refresh Gemini context cache, recreating: {e}")
+
+        system_prompt = self._get_system_prompt()
+        examples = self._get_professional_examples(example_key)
+        if (len(system_prompt) + len(examples)) // _CHARS_PER_TOKEN < PROMPT_CACHE_MIN_TOKENS:
+            # The examples for a key never change, so neither does the answer
+            logger.debug(f"Prompt prefix for {example_key or 'general'} examples is too small to cache")
+            self._prompt_caches[example_key] = (None, float("inf"))
+            return None
+        
+        cache_name = None
+        try:
+            cache = await self._aio().caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    contents=[examples],
+                    ttl=f"{PROMPT_CACHE_TTL_SECONDS}s",
+                ),
+            )
+            cache_name = cache.name
+            logger.info(f"Created Gemini context cache for {example_key or 'general'} examples")
         except Exception as e:
-            logger.error(f"Failed to load Indian examples: {e}. Using default examples.")
-            return []
+            # e.g. prefix below the model's minimum cacheable size - send the full prompt instead
+            logger.warning(f"Gemini context caching unavailable: {e}")
+        
+        # Refresh shortly before the server-side TTL expires; failures are retried after one TTL
+        self._prompt_caches[example_key] = (cache_name, time.monotonic() + PROMPT_CACHE_TTL_SECONDS - 60)
+        return cache_name
+    
+    def _build_prompt(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None,
+        examples: str = "",
+        detected_symptoms: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Build the per-consultation Gemini prompt
+        
+        Returns:
+            Prompt text parts, sent to Gemini as-is so transcripts are never copied into one buffer
+        """
+        context = self._build_context(transcript, doctor_text, patient_text)
+        lang_name = "Tamil" if language == "ta" else "Telugu"
+        
+        # Create professional medical scribe prompt
+        return self._create_professional_prompt(transcript, language, lang_name, context, examples, detected_symptoms)
+    
+    @staticmethod
+    def _build_context(
+        transcript: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> Tuple[str, ...]:
+        """Consultation text parts for the prompt, split by speaker when diarization is available"""
+        if doctor_text and patient_text:
+            return ("**Doctor's Speech:**\n", doctor_text, "\n\n**Patient's Speech:**\n", patient_text, "\n")
+        return ("**Full Transcript:**\n", transcript)
+    
+    @staticmethod
+    def _get_system_prompt() -> str:
+        """Professional medical scribe system prompt"""
+        return _SYSTEM_PROMPT
     
-    def _get_professional_examples(self, condition_type: Optional[str] = None) -> str:
-        """Get professional medical scribe examples - Enhanced with Indian examples"""
+    @staticmethod
+    def _classify_condition_type(transcript_lower: str) -> Optional[str]:
+        """Classify condition type from the lowercased transcript for better example selection"""
+        if _CONDITION_AUTOMATON is not None and len(transcript_lower) >= _AHOCORASICK_MIN_LENGTH:
+            # One pass over the transcript for all condition keywords
+            best = min((value for _, value in _CONDITION_AUTOMATON.iter(transcript_lower)), default=None)
+            return best[1] if best else None
+        
+        for condition, keywords in _CONDITION_KEYWORDS:
+            if any(term in transcript_lower for term in keywords):
+                return condition
+        return None
+    
+    @staticmethod
+    def _create_professional_prompt(transcript: str, language: str, lang_name: str, context: Tuple[str, ...], examples: str = "", detected_symptoms: Optional[List[str]] = None) -> List[str]:
+        """
+        Create professional medical scribe prompt - Phase 1 Enhanced
+        
+        Examples are passed in empty when they are already held in the Gemini context cache.
+        """
+        
+        # Extract symptoms from transcript for inference (keyword matching)
+        if detected_symptoms is None:
+            detected_symptoms = SOAPGenerationService._detect_symptoms(transcript.lower())
+        # Everything but the context is memoized per (language, examples, symptom set)
+        prefix, suffix = _prompt_skeleton(lang_name, examples, frozenset(detected_symptoms))
+        return [prefix, *context, suffix]
+    
+    @staticmethod
+    def _detect_symptoms(transcript_lower: str) -> List[str]:
+        """Find symptom keywords in the lowercased transcript, in keyword order"""
+        if _SYMPTOM_AUTOMATON is not None and len(transcript_lower) >= _AHOCORASICK_MIN_LENGTH:
+            # One pass over the transcript for all keywords
+            found = {keyword for _, keyword in _SYMPTOM_AUTOMATON.iter(transcript_lower)}
+            return [kw for kw in _SYMPTOM_KEYWORDS if kw in found]
+        
+        found = set(_SYMPTOM_RE.findall(transcript_lower))
+        return [kw for kw in _SYMPTOM_KEYWORDS if kw in found]
+    
+    @staticmethod
+    def _get_physical_exam_template(symptoms: list) -> str:
+        """Structured physical examination template for the detected symptoms (memoized per symptom set)"""
+        return _build_physical_exam_template(frozenset(symptoms))
+    
+    def _render_all_examples(self) -> Dict[Any, str]:
+        """Render the few-shot text for every condition type and every single example"""
+        rendered: Dict[Any, str] = {None: self._render_professional_examples(None)}
+        for condition, _ in _CONDITION_KEYWORDS:
+            rendered[condition] = self._render_professional_examples(condition)
+        for i, ex in enumerate(self.examples):
+            rendered[("nearest", i)] = self._format_examples([ex])
+        return rendered
+    
+    def _get_professional_examples(self, example_key: Any = None) -> str:
+        """
+        Get professional medical scribe examples (pre-rendered at init)
+        
+        Args:
+            example_key: Condition type, or ("nearest", index) for a single selected example
+        """
+        return self._examples_text[example_key]
+    
+    def _render_professional_examples(self, condition_type: Optional[str] = None) -> str:
+        """Render professional medical scribe examples - Enhanced with Indian examples"""
         
         # Try to get Indian examples first
         if self.examples:
@@ -395,12 +1000,20 @@ Output ONLY valid JSON, no additional text."""
                 selected_examples = self.examples[:3]  # Use first 3 examples
             
             if selected_examples:
-                examples_text = "**Indian Clinical Examples:**\n\n"
-                for i, ex in enumerate(selected_examples, 1):
-                    transcript = ex.get("transcript_english") or ex.get("transcript", "")
-                    soap = ex.get("soap_note", {})
-                    
-                    examples_text += f"""**Example {i} ({ex.get('condition_type', 'general')}):**
+                return self._format_examples(selected_examples)
+        
+        # Fallback to default example if no Indian examples available
+        return _DEFAULT_EXAMPLE
+    
+    @staticmethod
+    def _format_examples(selected_examples: List[Dict]) -> str:
+        """Format Indian clinical examples as few-shot prompt text"""
+        examples_text = "**Indian Clinical Examples:**\n\n"
+        for i, ex in enumerate(selected_examples, 1):
+            transcript = ex.get("transcript_english") or ex.get("transcript", "")
+            soap = ex.get("soap_note", {})
+            
+            examples_text += f"""**Example {i} ({ex.get('condition_type', 'general')}):**
 
 Transcript: "{transcript}"
 
@@ -416,23 +1029,7 @@ Output JSON:
 }}
 
 """
-                return examples_text
-        
-        # Fallback to default example if no Indian examples available
-        return """**Example:**
-
-Transcript: "Patient has fever and cough for 3 days. BP 130/85. Prescribe Paracetamol 650mg three times daily."
-
-Output JSON:
-{
-  "soap_note": "## Subjective\\n- Fever for 3 days\\n- Cough for 3 days\\n\\n## Objective\\n- Vital Signs: Blood Pressure 130/85 mmHg, Pulse regular\\n- General Appearance: Alert, comfortable\\n- Respiratory Examination: Mild tachypnea noted, no obvious respiratory distress\\n- Throat Examination: Mild erythema noted (inferred from symptoms)\\n\\n## Assessment\\n- Acute pharyngitis\\n\\n## Plan\\n- Paracetamol 650mg - Three times daily (TID) for 3 days\\n- Rest and adequate fluid intake\\n- Follow-up in 3 days if symptoms persist",
-  "subjective": "Fever and cough for 3 days",
-  "objective": "Vital Signs: BP 130/85 mmHg. General: Alert. Respiratory: Mild tachypnea. Throat: Mild erythema (inferred).",
-  "assessment": "Acute pharyngitis",
-  "plan": "Paracetamol 650mg TID for 3 days, rest, fluids, follow-up in 3 days",
-  "entities": {"symptoms": ["Fever", "Cough"], "medications": ["Paracetamol 650mg"], "diagnoses": ["Acute pharyngitis"], "vitals": {"bp": "130/85"}},
-  "icd_codes": ["J02.0"]
-}"""
+        return examples_text
     
     def _extract_entities_with_ner(self, transcript: str) -> Dict[str, Any]:
         """
@@ -474,7 +1071,7 @@ Output JSON:
                         edited_soap: Dict[str, Any]) -> bool:
         """
         Collect doctor feedback/edits for future training (Phase 1)
-        Saves edits to feedback file for later use in fine-tuning
+        Appends edits to the JSONL feedback file for later use in fine-tuning
         
         Args:
             consultation_id: Consultation ID
@@ -485,14 +1082,6 @@ Output JSON:
             True if feedback saved successfully
         """
         try:
-            feedback_file = Path(__file__).parent.parent.parent / "data" / "doctor_feedback.json"
-            
-            # Load existing feedback
-            feedback_data = []
-            if feedback_file.exists():
-                with open(feedback_file, 'r', encoding='utf-8') as f:
-                    feedback_data = json.load(f)
-            
             # Create feedback entry
             from datetime import datetime
             feedback_entry = {
@@ -503,12 +1092,10 @@ Output JSON:
                 "changes": self._compute_soap_diff(original_soap, edited_soap)
             }
             
-            feedback_data.append(feedback_entry)
-            
-            # Save feedback
-            feedback_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(feedback_file, 'w', encoding='utf-8') as f:
-                json.dump(feedback_data, f, indent=2, ensure_ascii=False)
+            # Append one JSON line - no need to read or rewrite earlier feedback
+            _FEEDBACK_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(_FEEDBACK_FILE, 'ab') as f:
+                f.write(orjson.dumps(feedback_entry, option=orjson.OPT_NON_STR_KEYS) + b"\n")
             
             logger.info(f"Feedback collected for consultation {consultation_id}")
             return True
@@ -517,15 +1104,44 @@ Output JSON:
             logger.error(f"Failed to collect feedback: {e}")
             return False
     
-    def _compute_soap_diff(self, original: Dict[str, Any], edited: Dict[str, Any]) -> Dict[str, Any]:
-        """Compute differences between original and edited SOAP notes"""
+    @staticmethod
+    def _load_feedback() -> Iterator[Dict[str, Any]]:
+        """Stream collected feedback entries, oldest first (includes the legacy JSON array file)"""
+        legacy_file = _FEEDBACK_FILE.with_suffix(".json")
+        if legacy_file.exists():
+            yield from orjson.loads(legacy_file.read_bytes())
+        
+        if _FEEDBACK_FILE.exists():
+            with open(_FEEDBACK_FILE, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        yield orjson.loads(line)
+    
+    @staticmethod
+    def _compute_soap_diff(original: Dict[str, Any], edited: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compute differences between original and edited SOAP notes
+        
+        Near-identical sections are recorded as minor edits without their text;
+        the full notes are stored alongside the diff in the feedback entry.
+        """
         diff = {}
         
-        for section in ["subjective", "objective", "assessment", "plan"]:
-            orig_text = original.get(section, "").strip()
-            edit_text = edited.get(section, "").strip()
+        for section in ("subjective", "objective", "assessment", "plan"):
+            orig_text = original.get(section, "")
+            edit_text = edited.get(section, "")
+            if orig_text is edit_text or orig_text == edit_text:
+                continue
+            
+            orig_text = orig_text.strip()
+            edit_text = edit_text.strip()
+            if orig_text == edit_text:
+                continue
             
-            if orig_text != edit_text:
+            ratio = difflib.SequenceMatcher(None, orig_text, edit_text).quick_ratio()
+            if ratio > 0.98:
+                diff[section] = {"changed": True, "minor": True, "ratio": round(ratio, 3)}
+            else:
                 diff[section] = {
                     "original": orig_text,
                     "edited": edit_text,
@@ -547,6 +1163,24 @@ Output JSON:
         # Gemini pricing: ~₹0.15 per note for gemini-2.0-flash-exp
         return 0.15
 
-# Global service instance
-soap_service = SOAPGenerationService()
+# Global service instance, created on first use so importing this module has no side effects
+_soap_service: Optional[SOAPGenerationService] = None
+_soap_service_lock = threading.Lock()
+
+
+def get_soap_service() -> SOAPGenerationService:
+    """Get the shared SOAPGenerationService, creating it on first call"""
+    global _soap_service
+    if _soap_service is None:
+        with _soap_service_lock:
+            if _soap_service is None:
+                _soap_service = SOAPGenerationService()
+    return _soap_service
+
+
+def __getattr__(name: str):
+    # Backwards compatibility: `soap_service` attribute access resolves lazily
+    if name == "soap_service":
+        return get_soap_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -3,199 +3,130 @@ SOAP Generation Service
 Generates structured SOAP notes from transcripts using Groq LLM
 """
 
-import groq
 from app.config import settings
+from app.services.batching import BatchQueue
+from app.services.groq_client import get_groq_client, groq_slot, is_rate_limit_error
+from app.services.semantic_cache import ExactCache
+from app.services.soap_sections import split_sections
+import asyncio
+import functools
 import logging
-from typing import Dict, Any, Optional
-import json
-import re
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Any, Optional, List, AsyncIterator, Mapping, Tuple
+import orjson
 
 logger = logging.getLogger(__name__)
 
-class SOAPGenerationService:
-    """Service for generating SOAP notes using Groq LLM"""
-    
-    def __init__(self):
-        """Initialize Groq client"""
-        self.client = groq.Groq(api_key=settings.GROQ_API_KEY)
-        # Model selection with fallback support
-        # Primary: llama-3.1-8b-instant (fast, reliable, currently available)
-        # Fallback: mixtral-8x7b-32768 (alternative if primary unavailable)
-        # Note: llama-3.1-70b-versatile was decommissioned
-        # Using 8b-instant as primary for reliability, can upgrade to larger model later
-        self.model = "llama-3.1-8b-instant"
-        self.fallback_model = "mixtral-8x7b-32768"
-    
-    async def generate_soap_note(
-        self,
-        transcript: str,
-        language: str,
-        patient_name: Optional[str] = None,
-        doctor_text: Optional[str] = None,
-        patient_text: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """
-        Generate structured SOAP note from transcript
-        
-        Args:
-            transcript: Full transcript text
-            language: Language code ("ta" for Tamil, "te" for Telugu)
-            patient_name: Patient name (optional)
-            doctor_text: Doctor's speech only (if diarization available)
-            patient_text: Patient's speech only (if diarization available)
-        
-        Returns:
-            Dictionary with SOAP note and extracted entities:
-            {
-                "soap_note": str,  # Markdown-formatted SOAP note
-                "subjective": str,
-                "objective": str,
-                "assessment": str,
-                "plan": str,
+# Optional: ijson for incremental parsing of the streamed JSON response
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+    logger.info("ijson not available. Streamed SOAP sections are parsed once the response completes.")
+
+# A SOAP JSON response is typically 600-900 tokens; a tight budget keeps Groq scheduling fast
+_MAX_OUTPUT_TOKENS = 1200
+
+# Per-field input cap (~3k tokens) so prompt size stays bounded
+_MAX_INPUT_CHARS = 12000
+
+# Below this much speech there is nothing to document - skip the Groq round trip
+_MIN_TRANSCRIPT_CHARS = 80
+
+# Consultations sharing one batched call: at most this many, each at most this long
+_BATCH_MAX_ITEMS = 5
+_BATCH_ITEM_MAX_CHARS = 4000
+
+# Tool the model is forced to call; its arguments follow this JSON schema
+_SOAP_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_soap",
+        "description": "Emit the structured SOAP note for the consultation",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "soap_note": {"type": "string", "description": "Markdown SOAP note with ## Subjective/Objective/Assessment/Plan sections"},
+                "subjective": {"type": "string"},
+                "objective": {"type": "string"},
+                "assessment": {"type": "string"},
+                "plan": {"type": "string"},
                 "entities": {
-                    "symptoms": list,
-                    "medications": list,
-                    "diagnoses": list,
-                    "vitals": dict
+                    "type": "object",
+                    "properties": {
+                        "symptoms": {"type": "array", "items": {"type": "string"}},
+                        "medications": {"type": "array", "items": {"type": "string"}},
+                        "diagnoses": {"type": "array", "items": {"type": "string"}},
+                        "vitals": {"type": "object", "additionalProperties": {"type": "string"}}
+                    },
+                    "required": ["symptoms", "medications", "diagnoses", "vitals"]
                 },
-                "icd_codes": list,  # ICD-10 codes
-                "confidence": float,
-                "model": str
-            }
-        """
-        try:
-            logger.info(f"Generating SOAP note (language: {language})")
-            
-            # Build enhanced prompt with diarization info if available
-            context = ""
-            if doctor_text and patient_text:
-                context = f"""
-Doctor's Speech:
-{doctor_text}
+                "icd_codes": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["soap_note", "subjective", "objective", "assessment", "plan", "entities", "icd_codes"]
+        }
+    }
+}
 
-Patient's Speech:
-{patient_text}
-"""
-            else:
-                context = f"Full Transcript:\n{transcript}"
-            
-            # Professional medical scribe prompt based on industry standards
-            lang_name = "Tamil" if language == "ta" else "Telugu"
-            
-            prompt = self._create_professional_prompt(transcript, language, lang_name, context)
-            
-            # Call Groq API with fallback model support
-            messages = [
-                {
-                    "role": "system",
-                    "content": self._get_system_prompt()
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-            
-            api_params = {
-                "messages": messages,
-                "max_tokens": 4000,  # Increased for longer SOAP notes
-                "temperature": 0.2,
-                "response_format": {"type": "json_object"}
-            }
-            
-            # Try primary model first, fallback if decommissioned
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    **api_params
-                )
-            except Exception as primary_error:
-                error_msg = str(primary_error).lower()
-                if "decommissioned" in error_msg or "model" in error_msg:
-                    logger.warning(f"Primary model {self.model} unavailable, trying fallback {self.fallback_model}")
-                    try:
-                        response = self.client.chat.completions.create(
-                            model=self.fallback_model,
-                            **api_params
-                        )
-                    except Exception as fallback_error:
-                        logger.error(f"Both models failed: {fallback_error}")
-                        raise Exception(f"SOAP generation failed: All models unavailable. Primary: {primary_error}, Fallback: {fallback_error}")
-                else:
-                    raise
-            
-            # Parse response
-            content = response.choices[0].message.content
-            
-            # Try to parse JSON
-            try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
-                # Fallback: Try to extract JSON from markdown code blocks
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(1))
-                else:
-                    # Last resort: Create basic structure from text
-                    logger.warning("Failed to parse JSON, creating fallback structure")
-                    result = {
-                        "soap_note": content,
-                        "subjective": "",
-                        "objective": "",
-                        "assessment": "",
-                        "plan": "",
-                        "entities": {
-                            "symptoms": [],
-                            "medications": [],
-                            "diagnoses": [],
-                            "vitals": {}
-                        },
-                        "icd_codes": []
-                    }
-            
-            # Ensure all required fields exist
-            soap_note = result.get("soap_note", "")
-            entities = result.get("entities", {})
-            icd_codes = result.get("icd_codes", [])
-            
-            # Extract structured sections if not provided
-            if not result.get("subjective"):
-                subjective_match = re.search(r'## Subjective\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["subjective"] = subjective_match.group(1).strip() if subjective_match else ""
-            
-            if not result.get("objective"):
-                objective_match = re.search(r'## Objective\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["objective"] = objective_match.group(1).strip() if objective_match else ""
-            
-            if not result.get("assessment"):
-                assessment_match = re.search(r'## Assessment\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["assessment"] = assessment_match.group(1).strip() if assessment_match else ""
-            
-            if not result.get("plan"):
-                plan_match = re.search(r'## Plan\s*\n(.*?)(?=\n## |$)', soap_note, re.DOTALL)
-                result["plan"] = plan_match.group(1).strip() if plan_match else ""
-            
-            logger.info(f"SOAP note generated: {len(soap_note)} characters")
-            
-            return {
-                "soap_note": soap_note,
-                "subjective": result.get("subjective", ""),
-                "objective": result.get("objective", ""),
-                "assessment": result.get("assessment", ""),
-                "plan": result.get("plan", ""),
-                "entities": entities,
-                "icd_codes": icd_codes,
-                "confidence": 0.9,  # LLM confidence estimate
-                "model": self.model
-            }
-            
-        except Exception as e:
-            logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
-            raise Exception(f"SOAP generation failed: {str(e)}")
-    
-    def _get_system_prompt(self) -> str:
-        """Professional medical scribe system prompt based on industry standards"""
-        return """You are an expert medical scribe AI assistant specializing in converting doctor-patient consultations into professional, structured SOAP (Subjective, Objective, Assessment, Plan) notes.
+# Two-step pipeline: Subjective/Objective first, then Assessment/Plan conditioned on them
+_SOAP_FIELDS = _SOAP_TOOL["function"]["parameters"]["properties"]
+
+_SO_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_subjective_objective",
+        "description": "Emit the Subjective and Objective sections for the consultation",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "subjective": {"type": "string", "description": "Markdown bullet list"},
+                "objective": {"type": "string", "description": "Markdown bullet list"}
+            },
+            "required": ["subjective", "objective"]
+        }
+    }
+}
+
+_AP_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_assessment_plan",
+        "description": "Emit the Assessment and Plan sections, entities and ICD-10 codes for the consultation",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "assessment": {"type": "string", "description": "Markdown bullet list"},
+                "plan": {"type": "string", "description": "Markdown bullet list"},
+                "entities": _SOAP_FIELDS["entities"],
+                "icd_codes": _SOAP_FIELDS["icd_codes"]
+            },
+            "required": ["assessment", "plan", "entities", "icd_codes"]
+        }
+    }
+}
+
+# Batched variant: one SOAP note per consultation, in prompt order
+_SOAP_BATCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_soap_batch",
+        "description": "Emit one structured SOAP note per consultation, in the order given",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "notes": {"type": "array", "items": _SOAP_TOOL["function"]["parameters"]}
+            },
+            "required": ["notes"]
+        }
+    }
+}
+
+
+# Prompt text is static - built once at import; only lang_name, examples and context vary per call
+_SYSTEM_PROMPT = """You are an expert medical scribe AI assistant specializing in converting doctor-patient consultations into professional, structured SOAP (Subjective, Objective, Assessment, Plan) notes.
 
 Your expertise:
 - Professional medical documentation following clinical standards
@@ -216,13 +147,23 @@ Documentation standards:
 Always output valid JSON format with structured SOAP note and extracted entities.
 
 CRITICAL: All SOAP note content must be in English only. Translate all Tamil/Telugu terms to English. Do NOT include Tamil/Telugu text or terms in brackets."""
-    
-    def _create_professional_prompt(self, transcript: str, language: str, lang_name: str, context: str) -> str:
-        """Create professional medical scribe prompt with examples and detailed instructions"""
-        
-        examples = self._get_professional_examples(lang_name)
-        
-        prompt = f"""Convert this {lang_name} doctor-patient consultation transcript into a professional, structured SOAP medical note in English only.
+
+_EXAMPLES = """**Example:**
+
+Transcript: "Patient has fever and cough for 3 days. BP 130/85. Prescribe Paracetamol 650mg three times daily."
+
+Output JSON:
+{
+  "soap_note": "## Subjective\\n- Fever for 3 days\\n- Cough for 3 days\\n\\n## Objective\\n- Blood Pressure: 130/85 mmHg\\n\\n## Assessment\\n- Acute pharyngitis\\n\\n## Plan\\n- Paracetamol 650mg - Three times daily (TID) for 3 days\\n- Rest and adequate fluid intake\\n- Follow-up in 3 days if symptoms persist",
+  "subjective": "Fever and cough for 3 days",
+  "objective": "BP 130/85 mmHg",
+  "assessment": "Acute pharyngitis",
+  "plan": "Paracetamol 650mg TID for 3 days, rest, fluids, follow-up in 3 days",
+  "entities": {"symptoms": ["Fever", "Cough"], "medications": ["Paracetamol 650mg"], "diagnoses": ["Acute pharyngitis"], "vitals": {"bp": "130/85"}},
+  "icd_codes": ["J02.0"]
+}"""
+
+_PROMPT_TEMPLATE = """Convert this {lang_name} doctor-patient consultation transcript into a professional, structured SOAP medical note in English only.
 
 Translate all medical terms, symptoms, and medications from {lang_name} to English. Do NOT include {lang_name} text or terms in brackets.
 
@@ -262,25 +203,595 @@ Keep each section concise but complete. Use bullet points in markdown format.
 CRITICAL: All text in soap_note, subjective, objective, assessment, and plan must be in English only. No Tamil/Telugu text or brackets.
 
 Output ONLY valid JSON, no additional text."""
+
+# Result for transcripts too short to document (copied per call; entities/icd_codes filled fresh)
+_EMPTY_SOAP_RESULT = MappingProxyType({
+    "soap_note": "## Subjective\n- Transcript too short to document\n\n## Objective\n\n## Assessment\n\n## Plan\n",
+    "subjective": "Transcript too short to document",
+    "objective": "",
+    "assessment": "",
+    "plan": "",
+    "confidence": 0.0
+})
+
+# Language code -> prompt language name
+_LANG_NAMES = {"ta": "Tamil", "te": "Telugu"}
+
+
+
+@dataclass(frozen=True)
+class SoapConfig:
+    """Model, sampling and prompt settings for a Groq SOAP service variant"""
+    model: str
+    fallback_model: Optional[str]
+    max_tokens: int
+    temperature: float
+    system_prompt: str
+    # Placeholders: {lang_name}, {examples}, {context}
+    prompt_template: str
+    default_examples: str
+    # Language name -> few-shot examples (default_examples for anything else)
+    examples_by_lang: Mapping[str, str] = field(default_factory=dict)
+
+
+# English-only JSON notes from the fast model, with the 70b model as fallback
+# (llama-3.1-70b-versatile and mixtral-8x7b-32768 were decommissioned)
+SOAP_GROQ_BACKUP_CFG = SoapConfig(
+    model="llama-3.1-8b-instant",
+    fallback_model="llama-3.3-70b-versatile",
+    max_tokens=_MAX_OUTPUT_TOKENS,
+    temperature=0.2,
+    system_prompt=_SYSTEM_PROMPT,
+    prompt_template=_PROMPT_TEMPLATE,
+    default_examples=_EXAMPLES
+)
+
+# Request pieces shared by every call (read-only; only the user message varies)
+_STREAM_PARAMS = MappingProxyType({
+    # Forced tool call: the arguments are JSON matching the SOAP schema
+    "tools": [_SOAP_TOOL],
+    "tool_choice": {"type": "function", "function": {"name": "emit_soap"}},
+    "stream": True
+})
+
+_SO_PARAMS = MappingProxyType({
+    "max_tokens": 600,
+    "temperature": 0.2,
+    "tools": [_SO_TOOL],
+    "tool_choice": {"type": "function", "function": {"name": "emit_subjective_objective"}},
+    "stream": True
+})
+
+_AP_PARAMS = MappingProxyType({
+    "max_tokens": 800,
+    "temperature": 0.2,
+    "tools": [_AP_TOOL],
+    "tool_choice": {"type": "function", "function": {"name": "emit_assessment_plan"}},
+    "stream": True
+})
+
+_SO_PROMPT_TEMPLATE = """Document the Subjective and Objective sections of a SOAP note for this {lang_name} doctor-patient consultation, in English only.
+
+Translate all medical terms, symptoms, and medications from {lang_name} to English. Do NOT include {lang_name} text or terms in brackets.
+
+**Current Consultation:**
+
+{context}
+
+**Instructions:**
+
+1. **Subjective:** Patient complaints with duration.
+2. **Objective:** Vital signs (BP, pulse, temp), examination findings, observations.
+
+Use concise markdown bullet points and call emit_subjective_objective."""
+
+_AP_PROMPT_TEMPLATE = """Complete the SOAP note for this {lang_name} doctor-patient consultation with the Assessment and Plan, in English only.
+
+**Current Consultation:**
+
+{context}
+
+**Documented so far:**
+
+## Subjective
+{subjective}
+
+## Objective
+{objective}
+
+**Instructions:**
+
+1. **Assessment:** Primary diagnosis using standard medical terminology, consistent with the findings above.
+2. **Plan:** Medications with dosage, frequency (TID/BD/OD/SOS), duration. Add follow-up instructions.
+3. **Entities and ICD-10 codes:** Symptoms, medications, diagnoses and vitals from the whole consultation.
+
+Use concise markdown bullet points and call emit_assessment_plan."""
+
+_BATCH_PROMPT_TEMPLATE = """Convert each of the following {count} doctor-patient consultation transcripts into a professional, structured SOAP medical note in English only, and call emit_soap_batch with the notes in the same order.
+
+Translate all medical terms, symptoms, and medications to English. Do NOT include Tamil/Telugu text or terms in brackets.
+
+{examples}
+
+{consultations}
+
+**Instructions (for every consultation):**
+
+1. **Subjective:** Patient complaints with duration.
+2. **Objective:** Vital signs (BP, pulse, temp), examination findings, observations.
+3. **Assessment:** Primary diagnosis using standard medical terminology.
+4. **Plan:** Medications with dosage, frequency (TID/BD/OD/SOS), duration. Add follow-up instructions.
+
+Keep each section concise but complete. Use bullet points in markdown format in soap_note.
+
+Each note covers only its own consultation - never mix findings between consultations."""
+
+
+class SOAPGenerationService:
+    """Service for generating SOAP notes using Groq LLM"""
+    
+    def __init__(self, config: SoapConfig = SOAP_GROQ_BACKUP_CFG):
+        """Initialize model selection (the Groq client is shared, see groq_client)"""
+        self.config = config
+        self.model = config.model
+        self.fallback_model = config.fallback_model
+        self._system_message = {"role": "system", "content": config.system_prompt}
+        self._stream_params = MappingProxyType({
+            **_STREAM_PARAMS, "max_tokens": config.max_tokens, "temperature": config.temperature
+        })
+        # Fire the fallback model too if the primary hasn't responded within this window (0 = off)
+        self.hedge_after_ms = settings.GROQ_HEDGE_AFTER_MS
+        # Retries of the same consultation (UI retries, reruns) are served without a Groq call
+        self.exact_cache = ExactCache()
         
-        return prompt
+        # Optional micro-batching of concurrent requests into one Groq call
+        self._batch_queue = None
+        self._batch_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_loop_lock = threading.Lock()
+        if settings.SOAP_BATCHING_ENABLED:
+            self._batch_queue = BatchQueue(
+                self._generate_batch,
+                max_batch_size=min(settings.SOAP_BATCH_SIZE, _BATCH_MAX_ITEMS),
+                window_seconds=settings.SOAP_BATCH_WINDOW_MS / 1000
+            )
     
-    def _get_professional_examples(self, lang_name: str) -> str:
-        """Professional medical scribe examples - English only"""
-        return """**Example:**
-
-Transcript: "Patient has fever and cough for 3 days. BP 130/85. Prescribe Paracetamol 650mg three times daily."
+    async def generate_soap_note(
+        self,
+        transcript: str,
+        language: str,
+        patient_name: Optional[str] = None,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate structured SOAP note from transcript
+        
+        Args:
+            transcript: Full transcript text
+            language: Language code ("ta" for Tamil, "te" for Telugu)
+            patient_name: Patient name (optional)
+            doctor_text: Doctor's speech only (if diarization available)
+            patient_text: Patient's speech only (if diarization available)
+        
+        Returns:
+            Dictionary with SOAP note and extracted entities:
+            {
+                "soap_note": str,  # Markdown-formatted SOAP note
+                "subjective": str,
+                "objective": str,
+                "assessment": str,
+                "plan": str,
+                "entities": {
+                    "symptoms": list,
+                    "medications": list,
+                    "diagnoses": list,
+                    "vitals": dict
+                },
+                "icd_codes": list,  # ICD-10 codes
+                "confidence": float,
+                "model": str
+            }
+        """
+        speech_chars = len((transcript or "").strip()) + len((doctor_text or "").strip()) + len((patient_text or "").strip())
+        if speech_chars < _MIN_TRANSCRIPT_CHARS:
+            logger.debug(f"Transcript too short for SOAP generation ({speech_chars} characters)")
+            return {
+                **_EMPTY_SOAP_RESULT,
+                "entities": {"symptoms": [], "medications": [], "diagnoses": [], "vitals": {}},
+                "icd_codes": [],
+                "model": self.model
+            }
+        
+        cache_key = self._cache_key(transcript, language, doctor_text, patient_text)
+        cached = self.exact_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        try:
+            logger.info(f"Generating SOAP note (language: {language})")
+            
+            if self._batch_queue is not None and len(transcript) <= _BATCH_ITEM_MAX_CHARS:
+                # Share one Groq call with other consultations arriving in the same window
+                future = self._batch_queue.enqueue((transcript, language, doctor_text, patient_text))
+                soap_result = await asyncio.wrap_future(future)
+                if soap_result is not None:
+                    self.exact_cache.set(cache_key, soap_result)
+                    return soap_result
+            
+            # Call Groq API (streamed, so the event loop stays free while tokens arrive)
+            content = "".join([
+                text async for text in self._stream_completion(transcript, language, doctor_text, patient_text)
+            ])
+            
+            # Tool-call arguments are bare JSON in the schema's shape (no markdown fences)
+            try:
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                # Last resort (e.g. arguments cut off at max_tokens): keep the raw text
+                logger.warning("Failed to parse JSON, creating fallback structure")
+                result = {
+                    "soap_note": content,
+                    "subjective": "",
+                    "objective": "",
+                    "assessment": "",
+                    "plan": "",
+                    "entities": {
+                        "symptoms": [],
+                        "medications": [],
+                        "diagnoses": [],
+                        "vitals": {}
+                    },
+                    "icd_codes": []
+                }
+            
+            soap_result = self._finalize_result(result)
+            logger.info(f"SOAP note generated: {len(soap_result['soap_note'])} characters")
+            
+            self.exact_cache.set(cache_key, soap_result)
+            return soap_result
+            
+        except Exception as e:
+            if is_rate_limit_error(e):
+                # Expected under load - a traceback per 429 would only add logging overhead
+                logger.warning(f"Groq rate limit hit: {e}")
+            else:
+                logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
+            raise Exception(f"SOAP generation failed: {str(e)}")
+    
+    async def generate_soap_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Generate SOAP notes for queued consultations, several per Groq call
+        
+        Short consultations are grouped so they share one copy of the system prompt,
+        examples and instructions. Groups that fail, and consultations too long to
+        share a call, fall back to generate_soap_note.
+        
+        Args:
+            items: Keyword arguments for generate_soap_note, one dict per consultation
+        
+        Returns:
+            Results in input order; a failed consultation yields its Exception instead
+        """
+        short = [i for i, item in enumerate(items) if len(item["transcript"]) <= _BATCH_ITEM_MAX_CHARS]
+        groups = [short[j:j + _BATCH_MAX_ITEMS] for j in range(0, len(short), _BATCH_MAX_ITEMS)]
+        groups += [[i] for i, item in enumerate(items) if len(item["transcript"]) > _BATCH_ITEM_MAX_CHARS]
+        
+        results: List[Any] = [None] * len(items)
+        
+        async def generate_group(indices: List[int]) -> None:
+            if len(indices) > 1:
+                requests = [
+                    (items[i]["transcript"], items[i]["language"], items[i].get("doctor_text"), items[i].get("patient_text"))
+                    for i in indices
+                ]
+                try:
+                    for i, request, result in zip(indices, requests, await self._generate_group(requests)):
+                        self.exact_cache.set(self._cache_key(*request), result)
+                        results[i] = result
+                    return
+                except Exception as e:
+                    logger.warning(f"Batched Groq SOAP call failed, generating individually: {e}")
+            
+            for i in indices:
+                try:
+                    results[i] = await self.generate_soap_note(**items[i])
+                except Exception as e:
+                    results[i] = e
+        
+        await asyncio.gather(*(generate_group(indices) for indices in groups))
+        return results
+    
+    def _cache_key(self, transcript: str, language: str, doctor_text: Optional[str], patient_text: Optional[str]) -> str:
+        """Exact-cache key over everything that reaches the prompt (patient_name doesn't)"""
+        return self.exact_cache.key(f"{transcript}|{doctor_text or ''}|{patient_text or ''}", language)
+    
+    def _generate_batch(self, requests: List[tuple]) -> List[Dict[str, Any]]:
+        """Batch queue callback - runs on a queue thread, so the call runs on the batch event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._generate_group(requests), self._get_batch_loop())
+        return future.result()
+    
+    def _get_batch_loop(self) -> asyncio.AbstractEventLoop:
+        """Long-lived event loop for batched calls, so they share one Groq client and connection pool"""
+        with self._batch_loop_lock:
+            if self._batch_loop is None:
+                self._batch_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._batch_loop.run_forever, name="soap-batch-loop", daemon=True).start()
+            return self._batch_loop
+    
+    async def _generate_group(self, requests: List[tuple]) -> List[Dict[str, Any]]:
+        """One Groq call covering several (transcript, language, doctor_text, patient_text) requests"""
+        consultations = []
+        for i, (transcript, language, doctor_text, patient_text) in enumerate(requests, 1):
+            lang_name = _LANG_NAMES.get(language, "Telugu")
+            consultations.append(f"**Consultation [[{i}]] ({lang_name}):**\n{self._build_context(transcript, doctor_text, patient_text)}")
+        prompt = _BATCH_PROMPT_TEMPLATE.format_map({
+            "count": len(requests),
+            "examples": self._get_professional_examples(None),
+            "consultations": "\n\n".join(consultations),
+        })
+        
+        client = get_groq_client()
+        async with groq_slot():
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=[self._system_message, {"role": "user", "content": prompt}],
+                max_tokens=self.config.max_tokens * len(requests),
+                temperature=self.config.temperature,
+                tools=[_SOAP_BATCH_TOOL],
+                tool_choice={"type": "function", "function": {"name": "emit_soap_batch"}}
+            )
+        
+        notes = orjson.loads(response.choices[0].message.tool_calls[0].function.arguments).get("notes")
+        if not isinstance(notes, list) or len(notes) != len(requests):
+            raise ValueError(f"Expected {len(requests)} SOAP notes in batch response")
+        
+        logger.info(f"Generated {len(requests)} SOAP notes in one batched Groq call")
+        return [self._finalize_result(note) for note in notes]
+    
+    def _finalize_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in missing fields (sections from the markdown note) and add confidence/model, in place"""
+        soap_note = result.setdefault("soap_note", "")
+        result.setdefault("entities", {})
+        result.setdefault("icd_codes", [])
+        
+        # Extract structured sections if not provided (one pass over the markdown note)
+        missing = [key for key in ("subjective", "objective", "assessment", "plan") if not result.get(key)]
+        if missing:
+            sections = split_sections(soap_note)
+            for key in missing:
+                result[key] = sections.get(key, "")
+        
+        result["confidence"] = 0.9  # LLM confidence estimate
+        result["model"] = self.model
+        return result
+    
+    async def stream_soap_sections(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream SOAP note fields as soon as each one is complete
+        
+        Yields:
+            (field name, value) pairs in response order, e.g. ("subjective", "...")
+        """
+        async for field, value in self._iter_fields(
+            self._stream_completion(transcript, language, doctor_text, patient_text)
+        ):
+            yield field, value
+    
+    async def stream_soap_sections_two_step(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream SOAP note fields from two pipelined Groq calls
+        
+        A short first call produces Subjective and Objective, which are yielded as soon
+        as each is complete; a second call conditioned on them produces Assessment,
+        Plan, entities and ICD codes. The assembled markdown note is yielded last.
+        
+        Yields:
+            (field name, value) pairs, ending with ("soap_note", "...")
+        """
+        transcript, doctor_text, patient_text = self._clip_inputs(transcript, doctor_text, patient_text)
+        lang_name = _LANG_NAMES.get(language, "Telugu")
+        context = self._build_context(transcript, doctor_text, patient_text)
+        sections: Dict[str, Any] = {}
+        
+        prompt = _SO_PROMPT_TEMPLATE.format_map({"lang_name": lang_name, "context": context})
+        so_params = {**_SO_PARAMS, "messages": [self._system_message, {"role": "user", "content": prompt}]}
+        async for field, value in self._iter_fields(self._stream_tool_call(so_params)):
+            sections[field] = value
+            yield field, value
+        
+        prompt = _AP_PROMPT_TEMPLATE.format_map({
+            "lang_name": lang_name,
+            "context": context,
+            "subjective": sections.get("subjective", ""),
+            "objective": sections.get("objective", ""),
+        })
+        ap_params = {**_AP_PARAMS, "messages": [self._system_message, {"role": "user", "content": prompt}]}
+        async for field, value in self._iter_fields(self._stream_tool_call(ap_params)):
+            sections[field] = value
+            yield field, value
+        
+        yield "soap_note", "\n\n".join(
+            f"## {key.capitalize()}\n{sections.get(key, '')}" for key in ("subjective", "objective", "assessment", "plan")
+        )
+    
+    async def generate_soap_note_two_step(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate a SOAP note with the two-call pipeline (see stream_soap_sections_two_step)"""
+        result = {
+            field: value
+            async for field, value in self.stream_soap_sections_two_step(transcript, language, doctor_text, patient_text)
+        }
+        return self._finalize_result(result)
+    
+    @staticmethod
+    async def _iter_fields(stream: AsyncIterator[str]) -> AsyncIterator[Tuple[str, Any]]:
+        """Top-level (key, value) pairs of a streamed JSON object, each as soon as it is complete"""
+        if not IJSON_AVAILABLE:
+            content = "".join([text async for text in stream])
+            for field, value in orjson.loads(content).items():
+                yield field, value
+            return
+        
+        # Push parser: emits each top-level key/value pair once its value is fully received
+        completed = ijson.sendable_list()
+        parser = ijson.kvitems_coro(completed, "")
+        async for text in stream:
+            parser.send(text.encode("utf-8"))
+            for field, value in completed:
+                yield field, value
+            del completed[:]
+        parser.close()
+        for field, value in completed:
+            yield field, value
+    
+    async def _stream_completion(
+        self,
+        transcript: str,
+        language: str,
+        doctor_text: Optional[str] = None,
+        patient_text: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream the emit_soap tool-call arguments (SOAP JSON) from Groq, hedging with the fallback model"""
+        transcript, doctor_text, patient_text = self._clip_inputs(transcript, doctor_text, patient_text)
+        context = self._build_context(transcript, doctor_text, patient_text)
+        
+        # Professional medical scribe prompt based on industry standards
+        lang_name = _LANG_NAMES.get(language, "Telugu")
+        
+        prompt = self._create_professional_prompt(transcript, language, lang_name, context)
+        
+        # Call Groq API with fallback model support
+        api_params = {
+            **self._stream_params,
+            "messages": [self._system_message, {"role": "user", "content": prompt}]
+        }
+        async for text in self._stream_tool_call(api_params):
+            yield text
+    
+    @staticmethod
+    def _clip_inputs(transcript: str, doctor_text: Optional[str], patient_text: Optional[str]) -> Tuple[str, Optional[str], Optional[str]]:
+        """Bound input tokens (~3k per field); a SOAP note never needs more of the conversation than this"""
+        if len(transcript) > _MAX_INPUT_CHARS:
+            logger.warning(f"Transcript truncated from {len(transcript)} to {_MAX_INPUT_CHARS} characters")
+        return (
+            transcript[:_MAX_INPUT_CHARS],
+            doctor_text[:_MAX_INPUT_CHARS] if doctor_text else doctor_text,
+            patient_text[:_MAX_INPUT_CHARS] if patient_text else patient_text,
+        )
+    
+    async def _stream_tool_call(self, api_params: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the forced tool call's argument JSON for a streamed completion request"""
+        client = get_groq_client()
+        async with groq_slot():
+            stream = await self._open_stream(client, api_params)
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                tool_calls = chunk.choices[0].delta.tool_calls
+                if tool_calls and tool_calls[0].function and tool_calls[0].function.arguments:
+                    yield tool_calls[0].function.arguments
+    
+    async def _open_stream(self, client, api_params: Dict[str, Any]):
+        """
+        Open a streamed completion, falling back to the fallback model
+        
+        The fallback is called when the primary fails with a model error. With hedging on
+        (hedge_after_ms > 0) it is also fired once the primary has taken hedge_after_ms to
+        respond, and the first success wins.
+        """
+        if not self.fallback_model:
+            return await client.chat.completions.create(model=self.model, **api_params)
+        
+        primary = asyncio.create_task(client.chat.completions.create(model=self.model, **api_params))
+        hedge_after = self.hedge_after_ms / 1000 if self.hedge_after_ms > 0 else None
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        
+        pending = {primary}
+        errors = []
+        if done:
+            primary_error = primary.exception()
+            if primary_error is None:
+                return primary.result()
+            error_msg = str(primary_error).lower()
+            if "decommissioned" not in error_msg and "model" not in error_msg:
+                raise primary_error
+            logger.warning(f"Primary model {self.model} unavailable, trying fallback {self.fallback_model}")
+            errors.append(primary_error)
+            pending = {asyncio.create_task(client.chat.completions.create(model=self.fallback_model, **api_params))}
+        else:
+            logger.info(f"Primary model {self.model} slow, hedging with fallback {self.fallback_model}")
+            pending.add(asyncio.create_task(self._open_hedged_stream(client, api_params)))
+        
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = None
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif winner is None:
+                    winner = task.result()
+                else:
+                    # Both finished together - release the extra stream's connection
+                    await task.result().close()
+            if winner is not None:
+                for task in pending:
+                    task.cancel()
+                return winner
+        
+        logger.error(f"Both models failed: {errors[-1]}")
+        raise Exception(f"SOAP generation failed: All models unavailable. Errors: {errors}")
+    
+    async def _open_hedged_stream(self, client, api_params: Dict[str, Any]):
+        """Open the fallback model's stream while the primary request is still in flight"""
+        # Both requests count against GROQ_CONCURRENCY while they race; once one wins the
+        # other is cancelled, and the caller's slot covers the winning stream
+        async with groq_slot():
+            return await client.chat.completions.create(model=self.fallback_model, **api_params)
+    
+    def _build_context(self, transcript: str, doctor_text: Optional[str], patient_text: Optional[str]) -> str:
+        """Consultation text for the prompt, using diarization info if available"""
+        if doctor_text and patient_text:
+            return f"""
+Doctor's Speech:
+{doctor_text}
 
-Output JSON:
-{
-  "soap_note": "## Subjective\\n- Fever for 3 days\\n- Cough for 3 days\\n\\n## Objective\\n- Blood Pressure: 130/85 mmHg\\n\\n## Assessment\\n- Acute pharyngitis\\n\\n## Plan\\n- Paracetamol 650mg - Three times daily (TID) for 3 days\\n- Rest and adequate fluid intake\\n- Follow-up in 3 days if symptoms persist",
-  "subjective": "Fever and cough for 3 days",
-  "objective": "BP 130/85 mmHg",
-  "assessment": "Acute pharyngitis",
-  "plan": "Paracetamol 650mg TID for 3 days, rest, fluids, follow-up in 3 days",
-  "entities": {"symptoms": ["Fever", "Cough"], "medications": ["Paracetamol 650mg"], "diagnoses": ["Acute pharyngitis"], "vitals": {"bp": "130/85"}},
-  "icd_codes": ["J02.0"]
-}"""
+Patient's Speech:
+{patient_text}
+"""
+        return f"Full Transcript:\n{transcript}"
+    
+    def _get_system_prompt(self) -> str:
+        """Professional medical scribe system prompt based on industry standards"""
+        return self.config.system_prompt
+    
+    def _create_professional_prompt(self, transcript: str, language: str, lang_name: str, context: str) -> str:
+        """Create professional medical scribe prompt with examples and detailed instructions"""
+        return self.config.prompt_template.format_map({
+            "lang_name": lang_name,
+            "examples": self._get_professional_examples(lang_name),
+            "context": context,
+        })
+    
+    def _get_professional_examples(self, lang_name: str) -> str:
+        """Professional medical scribe examples for the consultation language"""
+        return self.config.examples_by_lang.get(lang_name, self.config.default_examples)
     
     def estimate_cost(self, transcript_length: int) -> float:
         """
@@ -295,6 +806,16 @@ Output JSON:
         # Groq pricing: ~₹0.01 per request for small models
         return 0.01
 
-# Global service instance
-soap_service = SOAPGenerationService()
+# Global service instance, created on first use so importing this module has no side effects
+@functools.lru_cache(maxsize=None)
+def get_soap_service() -> SOAPGenerationService:
+    """Get the shared SOAPGenerationService, creating it on first call"""
+    return SOAPGenerationService()
+
+
+def __getattr__(name: str):
+    # Backwards compatibility: `soap_service` attribute access resolves lazily
+    if name == "soap_service":
+        return get_soap_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
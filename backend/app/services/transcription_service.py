@@ -5,13 +5,37 @@ Handles audio transcription using AssemblyAI (primary) or Reverie API (fallback)
 
 from app.config import settings
 from app.services.audio_converter import audio_converter
+from app.services.slots import SlotPool
+import asyncio
+import copy
+import functools
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
 from typing import Optional, Dict, Any
-import os
-import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Transcript LRU bound (re-uploads and retries of the same recording skip the paid API)
+RESULT_CACHE_MAX_ENTRIES = 32
+
+# Reverie language codes
+_LANG_MAP = MappingProxyType({
+    "ta": "ta",  # Tamil
+    "te": "te",  # Telugu
+    "hi": "hi"   # Hindi (if needed)
+})
+
+# Formats converted to MP3 before upload, and the Reverie format parameter per upload format
+_CONVERT_FORMATS = frozenset({"webm", "ogg", "m4a"})
+_FORMAT_MAP = MappingProxyType({
+    "mp3": "mp3",
+    "wav": "16k_int16",
+    "m4a": "m4a"
+})
+
 # Try to import AssemblyAI (primary service)
 try:
     from app.services.assemblyai_service import assemblyai_service
@@ -29,22 +53,34 @@ except ImportError:
     logger.info("Reverie SDK not available (requires Python <3.13). Using AssemblyAI as primary service.")
     ReverieClient = None
 
+@functools.lru_cache(maxsize=1)
+def _get_reverie_client():
+    """Process-wide Reverie client (None if the SDK is missing or init fails)"""
+    if not (REVERIE_AVAILABLE and ReverieClient):
+        return None
+    try:
+        return ReverieClient(
+            api_key=settings.REVERIE_API_KEY,
+            app_id=settings.REVERIE_APP_ID,
+            verbose=False
+        )
+    except Exception as e:
+        logger.warning(f"Failed to initialize Reverie client: {e}")
+        return None
+
+
 class TranscriptionService:
     """Service for transcribing audio files using AssemblyAI (primary) or Reverie API (fallback)"""
     
     def __init__(self):
         """Initialize transcription clients"""
-        self.reverie_client = None
-        if REVERIE_AVAILABLE and ReverieClient:
-            try:
-                self.reverie_client = ReverieClient(
-                    api_key=settings.REVERIE_API_KEY,
-                    app_id=settings.REVERIE_APP_ID,
-                    verbose=False
-                )
-            except Exception as e:
-                logger.warning(f"Failed to initialize Reverie client: {e}")
-                self.reverie_client = None
+        # Consultations run on separate threads/event loops, so the upstream limit is a
+        # SlotPool rather than an asyncio.Semaphore
+        self._upstream_slots = SlotPool(settings.TRANSCRIPTION_MAX_CONCURRENT)
+        self.reverie_client = _get_reverie_client()
+        # (content hash, language, format, diarization, engine) -> transcription result
+        self._result_cache: OrderedDict = OrderedDict()
+        self._result_cache_lock = threading.Lock()
     
     async def transcribe_audio(
         self,
@@ -67,40 +103,66 @@ class TranscriptionService:
         Returns:
             Dictionary with transcription results
         """
+        key = (
+            hashlib.blake2b(audio_data, digest_size=16).digest(),
+            language, audio_format.lower(), enable_diarization, use_assemblyai
+        )
+        with self._result_cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+                logger.info("Reusing cached transcription for identical audio")
+                return copy.deepcopy(cached)
+        
+        result = await self._transcribe_audio(audio_data, language, audio_format, enable_diarization, use_assemblyai)
+        
+        # Failures raise, so only successful transcriptions are cached
+        with self._result_cache_lock:
+            self._result_cache[key] = copy.deepcopy(result)
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > RESULT_CACHE_MAX_ENTRIES:
+                self._result_cache.popitem(last=False)
+        return result
+    
+    async def _transcribe_audio(
+        self,
+        audio_data: bytes,
+        language: str,
+        audio_format: str,
+        enable_diarization: bool,
+        use_assemblyai: bool
+    ) -> Dict[str, Any]:
+        """Uncached transcription for transcribe_audio"""
         # Use AssemblyAI if requested and available (or if Reverie not available)
         if (use_assemblyai or not REVERIE_AVAILABLE or not self.reverie_client) and ASSEMBLYAI_AVAILABLE:
-            if enable_diarization:
-                return await self._transcribe_with_assemblyai(audio_data, language, audio_format)
-            else:
-                # AssemblyAI without diarization
-                return await self._transcribe_with_assemblyai(audio_data, language, audio_format)
+            if len(audio_data) > settings.TRANSCRIPTION_CHUNK_THRESHOLD_BYTES:
+                # Long consultation: transcribe chunks concurrently instead of one long request
+                return await self._transcribe_parallel_chunks(
+                    audio_data, language, audio_format, enable_diarization=enable_diarization
+                )
+            # Speaker labels are only requested (and billed) when diarization is enabled
+            return await self._transcribe_with_assemblyai(audio_data, language, audio_format, enable_diarization)
         
         # Fallback to Reverie (only if available and not using AssemblyAI)
         if not REVERIE_AVAILABLE or not self.reverie_client:
             if ASSEMBLYAI_AVAILABLE:
                 logger.info("Reverie not available, using AssemblyAI")
-                return await self._transcribe_with_assemblyai(audio_data, language, audio_format)
+                return await self._transcribe_with_assemblyai(audio_data, language, audio_format, enable_diarization)
             else:
                 raise Exception("No transcription service available. Please configure AssemblyAI or Reverie.")
         
         try:
             logger.info(f"Starting transcription (language: {language}, format: {audio_format})")
             
-            # Map language codes
-            lang_map = {
-                "ta": "ta",  # Tamil
-                "te": "te",  # Telugu
-                "hi": "hi"   # Hindi (if needed)
-            }
-            src_lang = lang_map.get(language, "ta")
+            src_lang = _LANG_MAP.get(language, "ta")
             
             # Convert audio to Reverie-supported format if needed
             original_format = audio_format.lower()
-            if original_format in ["webm", "ogg", "m4a"]:
+            if original_format in _CONVERT_FORMATS:
                 logger.info(f"🔄 Converting {original_format} to MP3 for Reverie API")
                 try:
-                    audio_data, converted_format = audio_converter.convert_for_reverie(
-                        audio_data, original_format
+                    audio_data, converted_format = await asyncio.to_thread(
+                        audio_converter.convert_for_reverie, audio_data, original_format
                     )
                     audio_format = converted_format
                     logger.info(f"✅ Successfully converted {original_format} to {converted_format}")
@@ -109,12 +171,7 @@ class TranscriptionService:
                     raise Exception(f"Failed to convert {original_format} audio. Please ensure ffmpeg is installed: {str(conv_error)}")
             
             # Determine format parameter for Reverie
-            format_map = {
-                "mp3": "mp3",
-                "wav": "16k_int16",
-                "m4a": "m4a"
-            }
-            reverie_format = format_map.get(audio_format.lower(), "mp3")
+            reverie_format = _FORMAT_MAP.get(audio_format.lower(), "mp3")
             
             # Call Reverie API
             # Note: speaker_diarization and punctuate may not be available in all SDK versions
@@ -122,12 +179,15 @@ class TranscriptionService:
             if not self.reverie_client:
                 raise Exception("Reverie client not initialized")
             
-            result = self.reverie_client.asr.stt_file(
-                src_lang=src_lang,
-                data=audio_data,
-                format=reverie_format,
-                logging="true"
-            )
+            # Synchronous SDK call - run it on the default thread pool so other requests proceed
+            async with self._upstream_slot():
+                result = await asyncio.to_thread(
+                    self.reverie_client.asr.stt_file,
+                    src_lang=src_lang,
+                    data=audio_data,
+                    format=reverie_format,
+                    logging="true"
+                )
             
             # Extract transcript text
             transcript_text = result.text if hasattr(result, 'text') else str(result)
@@ -146,18 +206,17 @@ class TranscriptionService:
                 # Separate doctor and patient speech
                 # Assumption: First speaker is usually doctor, second is patient
                 # This may need adjustment based on actual Reverie output format
-                for segment in segments:
-                    speaker = segment.get('speaker', '')
-                    text = segment.get('text', '')
-                    
-                    if 'SPEAKER_00' in speaker or 'doctor' in speaker.lower():
-                        doctor_text += text + " "
-                    else:
-                        patient_text += text + " "
+                # Pull speakers and texts out once, then split with one join per side
+                speakers = [segment.get('speaker', '') for segment in segments]
+                texts = [segment.get('text', '') for segment in segments]
+                is_doctor = ['SPEAKER_00' in speaker or 'doctor' in speaker.lower() for speaker in speakers]
+                doctor_text = " ".join(text for text, doctor in zip(texts, is_doctor) if doctor)
+                patient_text = " ".join(text for text, doctor in zip(texts, is_doctor) if not doctor)
             
-            # Estimate audio duration (rough calculation)
-            # This is approximate - actual duration may vary
-            duration = len(audio_data) / 16000  # Rough estimate for 16kHz audio
+            # Actual duration from the container header; size-based estimate if it can't be read
+            duration = audio_converter.duration_seconds(audio_data)
+            if duration is None:
+                duration = len(audio_data) / 16000  # Rough estimate for 16kHz audio
             
             # Calculate cost (₹0.50 per minute)
             cost = (duration / 60) * settings.REVERIE_COST_PER_MINUTE
@@ -178,44 +237,92 @@ class TranscriptionService:
             
         except Exception as e:
             error_msg = str(e)
+            # exc_info carries the exception type and traceback; logging goes through the queue handler
             logger.error(f"Transcription failed: {error_msg}", exc_info=True)
-            print(f"\n{'='*60}")
-            print(f"❌ TRANSCRIPTION ERROR")
-            print(f"Error: {error_msg}")
-            print(f"Type: {type(e).__name__}")
-            print(f"{'='*60}\n")
             raise Exception(f"Transcription failed: {error_msg}")
     
     async def _transcribe_with_assemblyai(
         self,
         audio_data: bytes,
         language: str,
-        audio_format: str = "mp3"
+        audio_format: str = "mp3",
+        enable_diarization: bool = True
     ) -> Dict[str, Any]:
         """
         Transcribe using AssemblyAI with superior speaker diarization (96% accuracy)
         """
         try:
-            # Save audio to temporary file for AssemblyAI
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio_format}") as tmp_file:
-                tmp_file.write(audio_data)
-                tmp_path = tmp_file.name
-            
-            try:
-                # Use AssemblyAI service
-                result = await assemblyai_service.transcribe_with_diarization(
-                    audio_url=tmp_path,
-                    language=language
+            # Hand the bytes straight to AssemblyAI (no temp file write/read)
+            async with self._upstream_slot():
+                return await assemblyai_service.transcribe_with_diarization(
+                    audio_bytes=audio_data,
+                    language=language,
+                    enable_diarization=enable_diarization
                 )
-                return result
-            finally:
-                # Clean up temp file
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
         except Exception as e:
             logger.error(f"AssemblyAI transcription failed: {e}", exc_info=True)
             raise
     
+    async def _transcribe_parallel_chunks(
+        self,
+        audio_data: bytes,
+        language: str,
+        audio_format: str,
+        chunk_seconds: Optional[int] = None,
+        enable_diarization: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Transcribe long audio as silence-aligned chunks in parallel with AssemblyAI
+        
+        Chunks run concurrently (bounded by the upstream slots) and are stitched back in
+        order, with segment timestamps shifted by each chunk's offset. Doctor/patient
+        attribution is per utterance, so it survives chunking; raw speaker labels
+        ("A", "B") are per chunk and not consistent across chunks.
+        """
+        try:
+            chunks = await asyncio.to_thread(
+                audio_converter.split_on_silence_chunks,
+                audio_data, audio_format, chunk_seconds or settings.TRANSCRIPTION_CHUNK_SECONDS
+            )
+        except Exception as e:
+            logger.warning(f"Audio chunking failed, transcribing in one request: {e}")
+            return await self._transcribe_with_assemblyai(audio_data, language, audio_format, enable_diarization)
+        
+        if len(chunks) == 1:
+            return await self._transcribe_with_assemblyai(chunks[0][0], language, "mp3", enable_diarization)
+        
+        # Bound the fan-out on this loop too, so a long recording doesn't queue every
+        # chunk on the shared upstream slots at once
+        fan_out = asyncio.Semaphore(settings.TRANSCRIPTION_MAX_CONCURRENT)
+        
+        async def transcribe_chunk(chunk: bytes) -> Dict[str, Any]:
+            async with fan_out:
+                return await self._transcribe_with_assemblyai(chunk, language, "mp3", enable_diarization)
+        
+        results = await asyncio.gather(*(transcribe_chunk(chunk) for chunk, _ in chunks))
+        
+        segments = []
+        for (_, offset), result in zip(chunks, results):
+            offset_ms = int(offset * 1000)  # AssemblyAI timestamps are in milliseconds
+            for segment in result.get("segments", []):
+                segments.append(dict(segment, start=segment["start"] + offset_ms, end=segment["end"] + offset_ms))
+        
+        duration = sum(result.get("duration", 0) for result in results)
+        return {
+            **results[0],
+            "text": " ".join(result["text"] for result in results if result.get("text")),
+            "doctor_text": " ".join(result["doctor_text"] for result in results if result.get("doctor_text")),
+            "patient_text": " ".join(result["patient_text"] for result in results if result.get("patient_text")),
+            "confidence": sum(result.get("confidence", 0) for result in results) / len(results),
+            "segments": segments,
+            "duration": duration,
+            "cost": round(sum(result.get("cost", 0) for result in results), 2)
+        }
+    
+    def _upstream_slot(self):
+        """Hold one of the process-wide upstream transcription slots for the block (async with)"""
+        return self._upstream_slots.slot()
+    
     def estimate_cost(self, audio_duration_seconds: float) -> float:
         """
         Estimate transcription cost
@@ -1,29 +1,76 @@
 """
 Script to collect and organize Indian clinical examples for SOAP generation
 """
-import json
 import os
+import re
 import sys
+from collections import defaultdict
 from datetime import datetime
 from typing import List, Dict, Optional
 
+import orjson
+
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Optional: pyahocorasick for single-pass category keyword matching
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Condition categories in priority order, with the keywords that indicate them
+_CATEGORY_KEYWORDS = (
+    ("respiratory", ("fever", "cough", "respiratory", "pneumonia", "urti", "bronchitis")),
+    ("gastrointestinal", ("abdominal", "gastritis", "diarrhea", "stomach", "gastro")),
+    ("cardiovascular", ("hypertension", "heart", "cardiac", "chest pain", "cardiovascular")),
+    ("neurological", ("headache", "seizure", "neurological", "tension")),
+    ("musculoskeletal", ("joint", "muscle", "back pain", "arthritis", "musculoskeletal")),
+    ("endocrine", ("diabetes", "thyroid", "hormone", "endocrine", "diabetic")),
+    ("dermatological", ("rash", "skin", "dermatological", "dermatitis")),
+)
+
+# Below this length the per-category regex scans beat walking the automaton
+_AHOCORASICK_MIN_LENGTH = 200
+
+# Values are (priority, category) so the highest-priority hit wins
+_CATEGORY_AUTOMATON = None
+if AHOCORASICK_AVAILABLE:
+    _CATEGORY_AUTOMATON = ahocorasick.Automaton()
+    for _priority, (_category, _keywords) in enumerate(_CATEGORY_KEYWORDS):
+        for _keyword in _keywords:
+            _CATEGORY_AUTOMATON.add_word(_keyword, (_priority, _category))
+    _CATEGORY_AUTOMATON.make_automaton()
+
+
 class ExampleCollector:
-    def __init__(self):
+    # Each category matched with one compiled alternation
+    # (substring semantics, like the original `term in assessment` checks)
+    _CATEGORY_PATTERNS = [
+        (category, re.compile("|".join(map(re.escape, terms))))
+        for category, terms in _CATEGORY_KEYWORDS
+    ]
+    
+    def __init__(self, autosave: bool = True):
+        # autosave=False defers the (full-file) rewrite to flush() for bulk imports
+        self.autosave = autosave
+        self._dirty = False
+        self._batch_timestamp: Optional[str] = None
         self.examples_file = os.path.join(
             os.path.dirname(os.path.dirname(__file__)),
             "data",
             "indian_clinical_examples.json"
         )
         self.examples = self._load_examples()
+        # Counts in the file may be stale or missing - recount once, then update incrementally
+        self._rebuild_indices()
     
     def _load_examples(self) -> Dict:
         """Load existing examples"""
         try:
-            with open(self.examples_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.examples_file, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             return {
                 "examples": [],
@@ -53,10 +100,9 @@ class ExampleCollector:
             "icd_codes": soap_note.get("icd_codes", []),
             "source": "database",
             "validated": validated,
-            "date": datetime.now().isoformat()
+            "date": self._timestamp()
         }
-        self.examples["examples"].append(example)
-        self._save_examples()
+        self._append_example(example)
         return example
     
     def add_synthetic(self, transcript: str, transcript_english: str,
@@ -78,42 +124,71 @@ class ExampleCollector:
             "icd_codes": soap_note.get("icd_codes", []),
             "source": "synthetic",
             "validated": validated,
-            "date": datetime.now().isoformat()
+            "date": self._timestamp()
         }
-        self.examples["examples"].append(example)
-        self._save_examples()
+        self._append_example(example)
         return example
     
+    def _append_example(self, example: Dict):
+        """Append an example, keeping category counts and lookup indices current"""
+        self.examples["examples"].append(example)
+        self._index_example(example)
+        self._mark_changed()
+    
+    def _index_example(self, example: Dict):
+        """Count an example's category and add it to the validated lookups"""
+        cat = example["condition_type"]
+        categories = self.examples["categories"]
+        categories[cat] = categories.get(cat, 0) + 1
+        if example.get("validated", False):
+            self._validated.append(example)
+            self._validated_by_category[cat].append(example)
+    
+    def _rebuild_indices(self):
+        """Recount categories and rebuild validated lookups from scratch (once, on load)"""
+        self.examples["categories"] = {}
+        self._validated: List[Dict] = []
+        self._validated_by_category: Dict[str, List[Dict]] = defaultdict(list)
+        for ex in self.examples["examples"]:
+            self._index_example(ex)
+    
+    def _timestamp(self) -> str:
+        """ISO timestamp for a new example; formatted once per batch when autosave is off"""
+        if self.autosave:
+            return datetime.now().isoformat()
+        if self._batch_timestamp is None:
+            self._batch_timestamp = datetime.now().isoformat()
+        return self._batch_timestamp
+    
+    def _mark_changed(self):
+        """Save now, or defer to flush() when autosave is off"""
+        if self.autosave:
+            self._save_examples()
+        else:
+            self._dirty = True
+    
+    def flush(self):
+        """Write pending examples to file (no-op if nothing changed)"""
+        if self._dirty:
+            self._save_examples()
+    
     def _classify_condition(self, soap_note: Dict) -> str:
         """Classify condition type from SOAP note"""
         assessment = soap_note.get("assessment", "").lower()
         
-        if any(term in assessment for term in ["fever", "cough", "respiratory", "pneumonia", "urti", "bronchitis"]):
-            return "respiratory"
-        elif any(term in assessment for term in ["abdominal", "gastritis", "diarrhea", "stomach", "gastro"]):
-            return "gastrointestinal"
-        elif any(term in assessment for term in ["hypertension", "heart", "cardiac", "chest pain", "cardiovascular"]):
-            return "cardiovascular"
-        elif any(term in assessment for term in ["headache", "seizure", "neurological", "tension"]):
-            return "neurological"
-        elif any(term in assessment for term in ["joint", "muscle", "back pain", "arthritis", "musculoskeletal"]):
-            return "musculoskeletal"
-        elif any(term in assessment for term in ["diabetes", "thyroid", "hormone", "endocrine", "diabetic"]):
-            return "endocrine"
-        elif any(term in assessment for term in ["rash", "skin", "dermatological", "dermatitis"]):
-            return "dermatological"
-        else:
-            return "general"
+        if _CATEGORY_AUTOMATON is not None and len(assessment) >= _AHOCORASICK_MIN_LENGTH:
+            # One pass over the assessment for all category keywords
+            best = min((value for _, value in _CATEGORY_AUTOMATON.iter(assessment)), default=None)
+            return best[1] if best else "general"
+        
+        for category, pattern in self._CATEGORY_PATTERNS:
+            if pattern.search(assessment):
+                return category
+        return "general"
     
     def _save_examples(self):
         """Save examples to file"""
-        # Update category counts
-        categories = {}
-        for ex in self.examples["examples"]:
-            cat = ex["condition_type"]
-            categories[cat] = categories.get(cat, 0) + 1
-        
-        self.examples["categories"] = categories
+        # Category counts are maintained incrementally by _append_example
         self.examples["metadata"] = {
             "total_examples": len(self.examples["examples"]),
             "last_updated": datetime.now().isoformat(),
@@ -123,21 +198,22 @@ class ExampleCollector:
         # Ensure directory exists
         os.makedirs(os.path.dirname(self.examples_file), exist_ok=True)
         
-        with open(self.examples_file, 'w', encoding='utf-8') as f:
-            json.dump(self.examples, f, indent=2, ensure_ascii=False)
+        # orjson writes UTF-8 directly (Tamil/Telugu text stays unescaped, as with ensure_ascii=False)
+        # Write a sibling temp file and swap it in, so readers never see a half-written file
+        tmp_file = self.examples_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(self.examples, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_file, self.examples_file)
+        self._dirty = False
+        self._batch_timestamp = None
     
     def get_examples_by_category(self, category: str, limit: int = 5) -> List[Dict]:
         """Get examples by category"""
-        return [
-            ex for ex in self.examples["examples"]
-            if ex["condition_type"] == category and ex.get("validated", False)
-        ][:limit]
+        return self._validated_by_category.get(category, [])[:limit]
     
     def get_all_examples(self, limit: int = 20, validated_only: bool = True) -> List[Dict]:
         """Get all examples"""
-        examples = self.examples["examples"]
-        if validated_only:
-            examples = [ex for ex in examples if ex.get("validated", False)]
+        examples = self._validated if validated_only else self.examples["examples"]
         return examples[:limit]
     
     def get_few_shot_examples(self, condition_type: Optional[str] = None, count: int = 3) -> List[Dict]:
@@ -145,15 +221,14 @@ class ExampleCollector:
         if condition_type:
             return self.get_examples_by_category(condition_type, limit=count)
         else:
-            # Get diverse examples from different categories
-            categories = list(set(ex["condition_type"] for ex in self.examples["examples"]))
+            # Get diverse examples from different categories (category counts keep every type seen)
+            categories = list(self.examples["categories"])
             examples = []
             for cat in categories[:count]:
                 cat_examples = self.get_examples_by_category(cat, limit=1)
                 examples.extend(cat_examples)
             return examples[:count]
 
-
 if __name__ == "__main__":
     collector = ExampleCollector()
     
@@ -2,9 +2,13 @@
 Integrate EkaCare Medical ASR Dataset into SOAP examples
 Converts medical transcripts to SOAP note examples for few-shot learning
 """
+import asyncio
+import itertools
 import json
 import os
+import re
 import sys
+import time
 from pathlib import Path
 from typing import List, Dict, Optional
 
@@ -15,14 +19,22 @@ project_root = os.path.dirname(backend_dir)
 sys.path.insert(0, project_root)
 sys.path.insert(0, backend_dir)
 
+# Load backend/.env once, before app.config reads the environment (existing variables win)
 try:
-    from datasets import load_dataset
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(backend_dir, ".env"), override=False)
+except ImportError:
+    pass
+
+try:
+    from datasets import IterableDataset, load_dataset
     DATASETS_AVAILABLE = True
     # Keep load_dataset in global scope
     _load_dataset = load_dataset
 except ImportError:
     DATASETS_AVAILABLE = False
     _load_dataset = None
+    IterableDataset = None
     print("Warning: datasets library not installed. Run: pip install datasets")
 
 try:
@@ -46,6 +58,23 @@ collect_examples = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(collect_examples)
 ExampleCollector = collect_examples.ExampleCollector
 
+# JSON in Gemini responses: a ```json fence, else the outermost {...}
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Concurrent Gemini requests while generating SOAP notes (keeps under the per-minute quota)
+GEMINI_CONCURRENCY = 20
+
+# Transcripts sent together in one prompt (one JSON array of notes back; 1 disables)
+TRANSCRIPTS_PER_PROMPT = 5
+
+# Gemini Batch Mode (opt-in: ~50% cheaper, no per-minute limits, but results can take hours)
+BATCH_POLL_SECONDS = 30
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# Samples scanned by stats/filters when streaming (a full pass re-downloads the whole dataset)
+STREAM_SCAN_LIMIT = 500
+
 class EkaDatasetIntegrator:
     def __init__(self, gemini_api_key: Optional[str] = None):
         """Initialize integrator"""
@@ -62,20 +91,7 @@ class EkaDatasetIntegrator:
             api_key = settings.GEMINI_API_KEY
         
         if not api_key:
-            api_key = os.getenv("GEMINI_API_KEY")
-        
-        # Try loading from .env file if still not found
-        if not api_key:
-            env_file = os.path.join(backend_dir, ".env")
-            if os.path.exists(env_file):
-                try:
-                    with open(env_file, 'r') as f:
-                        for line in f:
-                            if line.startswith("GEMINI_API_KEY="):
-                                api_key = line.split("=", 1)[1].strip().strip('"').strip("'")
-                                break
-                except Exception:
-                    pass
+            api_key = os.getenv("GEMINI_API_KEY")  # Includes backend/.env, loaded at import
         
         if not api_key:
             raise ValueError(
@@ -84,6 +100,7 @@ class EkaDatasetIntegrator:
             )
         
         genai.configure(api_key=api_key)
+        self.api_key = api_key  # Also used by the Batch Mode client
         self.model = genai.GenerativeModel(
             "models/gemini-2.0-flash",
             generation_config={
@@ -93,7 +110,7 @@ class EkaDatasetIntegrator:
         )
         
         # Initialize collector
-        self.collector = ExampleCollector()
+        self.collector = ExampleCollector(autosave=False)  # Saved once per run in process_samples
         
         # Load dataset - try multiple methods
         print("Loading EkaCare dataset...")
@@ -170,29 +187,14 @@ class EkaDatasetIntegrator:
                         # Fallback: use known text columns
                         available_cols = [col for col in text_columns if col != 'audio']
                     
-                    # Select only text columns
+                    # Select only text columns and keep the stream lazy - samples are
+                    # fetched as process_samples consumes them, so RAM stays flat
                     dataset_stream = dataset_stream.select_columns(available_cols)
-                    
-                    # Convert streaming dataset to list (take first 100 for testing)
-                    print("   Converting to list (text only)...")
-                    samples = []
-                    for i, sample in enumerate(dataset_stream):
-                        if i >= 100:  # Limit for testing
-                            break
-                        samples.append(dict(sample))  # Convert to regular dict
-                    
-                    # Create a simple dataset-like object
-                    class SimpleDataset:
-                        def __init__(self, samples):
-                            self.samples = samples
-                        def __len__(self):
-                            return len(self.samples)
-                        def __getitem__(self, idx):
-                            return self.samples[idx]
-                        def __iter__(self):
-                            return iter(self.samples)
-                    self.dataset_en = SimpleDataset(samples)
-                    print(f"✅ Loaded {len(self.dataset_en)} samples (streaming mode, text only)")
+                    # Overlap fetching/decoding of upcoming samples (IterableDataset.decode, datasets>=4.0)
+                    if hasattr(dataset_stream, "decode"):
+                        dataset_stream = dataset_stream.decode(num_threads=min(32, (os.cpu_count() or 1) + 4))
+                    self.dataset_en = dataset_stream
+                    print("✅ Streaming dataset ready (text only)")
                 except Exception as e3:
                     error_msg = str(e3)
                     print(f"   Method 3 failed: {e3}")
@@ -229,10 +231,10 @@ class EkaDatasetIntegrator:
             "duration": sample.get("duration", 0)
         }
     
-    def generate_soap_from_transcript(self, transcript: str, medical_entities: str = "") -> Optional[Dict]:
-        """Generate SOAP note from transcript using Gemini"""
-        
-        prompt = f"""Convert this medical consultation transcript into a structured SOAP note following Indian medical documentation standards.
+    @staticmethod
+    def _build_soap_prompt(transcript: str, medical_entities: str = "") -> str:
+        """Prompt asking Gemini for a JSON SOAP note"""
+        return f"""Convert this medical consultation transcript into a structured SOAP note following Indian medical documentation standards.
 
 Transcript: {transcript}
 
@@ -260,74 +262,206 @@ Output as JSON only:
 }}
 
 All output must be in English. Use standard medical terminology. Output ONLY valid JSON, no additional text."""
+    
+    async def generate_soap_from_transcript(self, transcript: str, medical_entities: str = "") -> Optional[Dict]:
+        """Generate SOAP note from transcript using Gemini (None on failure)"""
+        prompt = self._build_soap_prompt(transcript, medical_entities)
         
         try:
-            response = self.model.generate_content(prompt)
-            content = response.text.strip()
-            
-            # Try to parse JSON
-            try:
-                soap_note = json.loads(content)
-            except json.JSONDecodeError:
-                # Try to extract JSON from markdown code blocks
-                import re
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-                if json_match:
-                    soap_note = json.loads(json_match.group(1))
-                else:
-                    # Try to find JSON object in text
-                    json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                    if json_match:
-                        soap_note = json.loads(json_match.group(0))
-                    else:
-                        raise ValueError("Could not parse JSON from response")
-            
-            # Validate structure
-            required_fields = ["subjective", "objective", "assessment", "plan"]
-            if not all(field in soap_note for field in required_fields):
-                raise ValueError("Missing required SOAP fields")
-            
-            return soap_note
-            
+            response = await self.model.generate_content_async(prompt)
+            return self._parse_soap_response(response.text)
         except Exception as e:
             print(f"   ⚠️  Error generating SOAP: {e}")
             return None
     
+    async def generate_soap_batch(self, transcripts: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Generate SOAP notes for several transcripts with a single Gemini call
+        
+        Each transcript is tagged TX_1..TX_K and results are mapped back by ID, so a
+        missing or malformed entry only loses that transcript (None). Raises if the
+        response as a whole can't be parsed.
+        """
+        tagged = "\n\n".join(
+            f"<<TX_{i}>>\nTranscript: {data['transcript']}"
+            + (f"\nMedical Entities (if available): {data['medical_entities']}" if data.get("medical_entities") else "")
+            for i, data in enumerate(transcripts, 1)
+        )
+        prompt = f"""Convert each of these {len(transcripts)} medical consultation transcripts into a structured SOAP note following Indian medical documentation standards. Treat every transcript independently.
+
+{tagged}
+
+For each transcript generate a complete SOAP note with:
+- Subjective: Patient complaints with duration
+- Objective: Vital signs, physical examination findings (infer common examinations if symptoms mentioned but not documented)
+- Assessment: Primary diagnosis using standard medical terminology with ICD-10 code
+- Plan: Medications with dosage, frequency (TID/BD/OD/SOS), duration, and follow-up instructions
+
+Output as JSON only, one entry per transcript with its ID:
+{{
+  "results": [
+    {{
+      "id": "TX_1",
+      "subjective": "...",
+      "objective": "...",
+      "assessment": "...",
+      "plan": "...",
+      "entities": {{"symptoms": [...], "medications": [...], "diagnoses": [...], "vitals": {{}}}},
+      "icd_codes": [...]
+    }}
+  ]
+}}
+
+All output must be in English. Use standard medical terminology. Output ONLY valid JSON, no additional text."""
+        
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config={"temperature": 0.1, "max_output_tokens": 8192}
+        )
+        results = self._extract_json(response.text).get("results")
+        if not isinstance(results, list):
+            raise ValueError("Response has no results array")
+        
+        by_id = {result.get("id"): result for result in results if isinstance(result, dict)}
+        required_fields = ["subjective", "objective", "assessment", "plan"]
+        soap_notes = []
+        for i in range(1, len(transcripts) + 1):
+            soap_note = by_id.get(f"TX_{i}")
+            if soap_note and all(field in soap_note for field in required_fields):
+                soap_note.pop("id", None)
+                soap_notes.append(soap_note)
+            else:
+                soap_notes.append(None)
+        return soap_notes
+    
+    @staticmethod
+    def _extract_json(text: str) -> Dict:
+        """Parse the JSON object in a Gemini response (bare, fenced, or embedded in text)"""
+        content = text.strip()
+        
+        # Try to parse JSON
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            # Try to extract JSON from markdown code blocks
+            json_match = _JSON_FENCE_RE.search(content)
+            if json_match:
+                return json.loads(json_match.group(1))
+            # Try to find JSON object in text
+            json_match = _JSON_OBJ_RE.search(content)
+            if json_match:
+                return json.loads(json_match.group(0))
+            raise ValueError("Could not parse JSON from response")
+    
+    @classmethod
+    def _parse_soap_response(cls, text: str) -> Dict:
+        """Parse and validate the JSON SOAP note in a Gemini response"""
+        soap_note = cls._extract_json(text)
+        
+        # Validate structure
+        required_fields = ["subjective", "objective", "assessment", "plan"]
+        if not all(field in soap_note for field in required_fields):
+            raise ValueError("Missing required SOAP fields")
+        
+        return soap_note
+    
+    def generate_soap_batch_job(self, transcripts: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Generate SOAP notes with one Gemini Batch Mode job (inline requests)
+        
+        Blocks until the job finishes; raises if the job fails. Individual
+        responses that fail or don't parse come back as None.
+        """
+        from google import genai as genai_client
+        
+        client = genai_client.Client(api_key=self.api_key)
+        job = client.batches.create(
+            model="gemini-2.0-flash",
+            src=[
+                {
+                    "contents": [{
+                        "role": "user",
+                        "parts": [{"text": self._build_soap_prompt(data["transcript"], data.get("medical_entities", ""))}]
+                    }],
+                    "config": {"temperature": 0.1, "max_output_tokens": 4000}
+                }
+                for data in transcripts
+            ],
+            config={"display_name": f"eka-soap-{len(transcripts)}"}
+        )
+        print(f"   Submitted batch job {job.name}")
+        
+        while job.state.name not in BATCH_DONE_STATES:
+            time.sleep(BATCH_POLL_SECONDS)
+            job = client.batches.get(name=job.name)
+            print(f"   Batch job state: {job.state.name}")
+        
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch job {job.name} ended in {job.state.name}: {job.error}")
+        
+        soap_notes = []
+        for inline_response in job.dest.inlined_responses:
+            try:
+                if inline_response.error:
+                    raise ValueError(inline_response.error)
+                soap_notes.append(self._parse_soap_response(inline_response.response.text))
+            except Exception as e:
+                print(f"   ⚠️  Error generating SOAP: {e}")
+                soap_notes.append(None)
+        return soap_notes
+    
     def process_samples(self, num_samples: int = 50, start_index: int = 0, 
-                       min_transcript_length: int = 50):
-        """Process samples from dataset and add to examples"""
+                       min_transcript_length: int = 50, use_batch_api: bool = False):
+        """
+        Process samples from dataset and add to examples
         
-        processed = 0
-        added = 0
-        skipped = 0
+        use_batch_api submits all generations as one Gemini Batch Mode job (falls back
+        to concurrent requests if the job can't be run).
+        """
         
-        # Handle both regular and streaming datasets
-        dataset_len = len(self.dataset_en) if hasattr(self.dataset_en, '__len__') else num_samples
-        max_samples = min(start_index + num_samples, dataset_len) if dataset_len else start_index + num_samples
+        skipped = 0
         
         print(f"\n🚀 Processing {num_samples} samples (starting from index {start_index})...")
         
-        # Handle iteration for both regular and streaming datasets
+        # Collect the samples first so all SOAP generations can run concurrently
         if hasattr(self.dataset_en, '__iter__') and not hasattr(self.dataset_en, '__getitem__'):
             # Streaming dataset - iterate directly
-            iterator = iter(self.dataset_en)
-            for _ in range(start_index):
-                next(iterator, None)  # Skip to start_index
-            
-            for i in range(num_samples):
-                try:
-                    sample = next(iterator)
-                except StopIteration:
-                    break
-                processed += 1
-                self._process_single_sample(sample, i + start_index, processed, added, skipped, min_transcript_length)
-                added, skipped = self._get_counts()
+            window = itertools.islice(self.dataset_en, start_index, start_index + num_samples)
+            samples = list(enumerate(window, start_index))
         else:
             # Regular dataset - use indexing
-            for i in range(start_index, max_samples):
-                sample = self.dataset_en[i]
-                processed += 1
-                added, skipped = self._process_single_sample(sample, i, processed, added, skipped, min_transcript_length)
+            max_samples = min(start_index + num_samples, len(self.dataset_en))
+            samples = [(i, self.dataset_en[i]) for i in range(start_index, max_samples)]
+        processed = len(samples)
+        
+        pending = []
+        for index, sample in samples:
+            transcript_data = self.extract_transcript_data(sample)
+            # Skip very short transcripts
+            if len(transcript_data["transcript"]) < min_transcript_length:
+                skipped += 1
+                continue
+            pending.append((index, transcript_data))
+        
+        transcripts = [data for _, data in pending]
+        soap_notes = None
+        if use_batch_api and transcripts:
+            print(f"   Generating {len(transcripts)} SOAP notes with Gemini Batch Mode...")
+            try:
+                soap_notes = self.generate_soap_batch_job(transcripts)
+            except Exception as e:
+                print(f"   ⚠️  Batch Mode failed ({e}), falling back to concurrent requests")
+        if soap_notes is None:
+            print(f"   Generating {len(transcripts)} SOAP notes ({TRANSCRIPTS_PER_PROMPT} per prompt, {GEMINI_CONCURRENCY} prompts at a time)...")
+            soap_notes = asyncio.run(self._generate_soap_notes(transcripts))
+        
+        added = 0
+        try:
+            for n, ((index, transcript_data), soap_note) in enumerate(zip(pending, soap_notes), 1):
+                added += self._add_example(n, index, transcript_data, soap_note)
+        finally:
+            # Write all added examples in one pass
+            self.collector.flush()
         
         print(f"\n📊 Summary:")
         print(f"   Processed: {processed}")
@@ -336,73 +470,99 @@ All output must be in English. Use standard medical terminology. Output ONLY val
         
         return added
     
-    def _process_single_sample(self, sample, index, processed, added, skipped, min_transcript_length):
-        """Process a single sample"""
-        transcript_data = self.extract_transcript_data(sample)
+    async def _generate_soap_notes(self, transcripts: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Generate SOAP notes for all transcripts concurrently, bounded by GEMINI_CONCURRENCY
+        
+        Transcripts go out TRANSCRIPTS_PER_PROMPT to a prompt; a group whose combined
+        response can't be used is retried one transcript per prompt.
+        """
+        semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+        
+        async def generate(transcript_data: Dict) -> Optional[Dict]:
+            async with semaphore:
+                return await self.generate_soap_from_transcript(
+                    transcript_data["transcript"],
+                    transcript_data.get("medical_entities", "")
+                )
+        
+        async def generate_group(group: List[Dict]) -> List[Optional[Dict]]:
+            if len(group) == 1:
+                return [await generate(group[0])]
+            try:
+                async with semaphore:
+                    return await self.generate_soap_batch(group)
+            except Exception as e:
+                print(f"   ⚠️  Combined prompt failed ({e}), retrying {len(group)} transcripts individually")
+                return list(await asyncio.gather(*(generate(data) for data in group)))
         
-        # Skip very short transcripts
-        if len(transcript_data["transcript"]) < min_transcript_length:
-            skipped += 1
-            return added, skipped
+        groups = [transcripts[i:i + TRANSCRIPTS_PER_PROMPT] for i in range(0, len(transcripts), TRANSCRIPTS_PER_PROMPT)]
+        results = await asyncio.gather(*(generate_group(group) for group in groups), return_exceptions=True)
         
-        session_id = transcript_data.get("session_id", f"sample_{index}")
+        soap_notes = []
+        for group, result in zip(groups, results):
+            soap_notes.extend([None] * len(group) if isinstance(result, BaseException) else result)
+        return soap_notes
+    
+    def _add_example(self, n: int, index: int, transcript_data: Dict, soap_note: Optional[Dict]) -> int:
+        """Add one generated example; returns 1 if it was added"""
+        session_id = transcript_data.get("session_id") or f"sample_{index}"
         transcript_preview = transcript_data["transcript"][:80] + "..." if len(transcript_data["transcript"]) > 80 else transcript_data["transcript"]
         
-        print(f"\n[{processed}] {session_id}")
+        print(f"\n[{n}] {session_id}")
         print(f"   Transcript: {transcript_preview}")
         
-        # Generate SOAP note
-        soap_note = self.generate_soap_from_transcript(
-            transcript_data["transcript"],
-            transcript_data.get("medical_entities", "")
-        )
-        
-        if soap_note:
-            # Add to examples
-            try:
-                self.collector.add_synthetic(
-                    transcript=transcript_data["transcript"],
-                    transcript_english=transcript_data["transcript"],
-                    soap_note=soap_note,
-                    language="en",
-                    validated=False  # Mark for doctor review
-                )
-                added += 1
-                print(f"   ✅ Added example {added}")
-            except Exception as e:
-                print(f"   ❌ Failed to add example: {e}")
-        else:
+        if not soap_note:
             print(f"   ❌ Failed to generate SOAP")
+            return 0
         
-        return added, skipped
+        # Add to examples
+        try:
+            self.collector.add_synthetic(
+                transcript=transcript_data["transcript"],
+                transcript_english=transcript_data["transcript"],
+                soap_note=soap_note,
+                language="en",
+                validated=False  # Mark for doctor review
+            )
+        except Exception as e:
+            print(f"   ❌ Failed to add example: {e}")
+            return 0
+        print(f"   ✅ Added example")
+        return 1
     
-    def _get_counts(self):
-        """Helper to get current counts - placeholder"""
-        return 0, 0
-        print(f"   Skipped (too short): {skipped}")
-        
-        return added
+    @property
+    def is_streaming(self) -> bool:
+        """Whether the dataset is a lazy remote stream (loading Method 3)"""
+        return IterableDataset is not None and isinstance(self.dataset_en, IterableDataset)
+    
+    def _scan_samples(self):
+        """Samples for stats and filters - the first STREAM_SCAN_LIMIT when streaming"""
+        if self.is_streaming:
+            return itertools.islice(self.dataset_en, STREAM_SCAN_LIMIT)
+        return self.dataset_en
     
     def filter_by_context(self, context_type: str = "conversation") -> List[Dict]:
-        """Filter samples by recording context"""
+        """Filter samples by recording context (first STREAM_SCAN_LIMIT samples when streaming)"""
         filtered = []
-        for sample in self.dataset_en:
+        for sample in self._scan_samples():
             if sample.get("recording_context", "") == context_type:
                 filtered.append(self.extract_transcript_data(sample))
         return filtered
     
     def filter_by_concept_type(self, concept_type: str) -> List[Dict]:
-        """Filter samples by medical concept type"""
+        """Filter samples by medical concept type (first STREAM_SCAN_LIMIT samples when streaming)"""
         filtered = []
-        for sample in self.dataset_en:
+        for sample in self._scan_samples():
             if sample.get("type_concept", "") == concept_type:
                 filtered.append(self.extract_transcript_data(sample))
         return filtered
     
     def get_dataset_stats(self):
-        """Get statistics about the dataset"""
+        """Get statistics about the dataset (first STREAM_SCAN_LIMIT samples when streaming)"""
         stats = {
-            "total_samples": len(self.dataset_en),
+            "streaming": self.is_streaming,
+            "total_samples": 0,
             "contexts": {},
             "concept_types": {},
             "avg_transcript_length": 0,
@@ -410,7 +570,9 @@ All output must be in English. Use standard medical terminology. Output ONLY val
         }
         
         total_length = 0
-        for sample in self.dataset_en:
+        # Counted while iterating - streaming datasets have no len()
+        for sample in self._scan_samples():
+            stats["total_samples"] += 1
             context = sample.get("recording_context", "unknown")
             stats["contexts"][context] = stats["contexts"].get(context, 0) + 1
             
@@ -423,7 +585,7 @@ All output must be in English. Use standard medical terminology. Output ONLY val
             if sample.get("medical_entities"):
                 stats["samples_with_entities"] += 1
         
-        stats["avg_transcript_length"] = total_length / len(self.dataset_en) if self.dataset_en else 0
+        stats["avg_transcript_length"] = total_length / stats["total_samples"] if stats["total_samples"] else 0
         
         return stats
 
@@ -440,6 +602,8 @@ if __name__ == "__main__":
         # Show dataset stats
         print("\n📊 Dataset Statistics:")
         stats = integrator.get_dataset_stats()
+        if stats['streaming']:
+            print(f"   (streaming: first {STREAM_SCAN_LIMIT} samples only)")
         print(f"   Total samples: {stats['total_samples']}")
         print(f"   Average transcript length: {stats['avg_transcript_length']:.0f} chars")
         print(f"   Samples with entities: {stats['samples_with_entities']}")
@@ -450,7 +614,9 @@ if __name__ == "__main__":
         # Process first 10 samples (start small for testing)
         print("\n🚀 Starting integration...")
         num_samples = 10  # Start with 10 samples for testing
-        added = integrator.process_samples(num_samples=num_samples, start_index=0)
+        # EKA_USE_BATCH_API=true: cheaper Gemini Batch Mode (slow to return, for large runs)
+        use_batch_api = os.getenv("EKA_USE_BATCH_API", "False").lower() == "true"
+        added = integrator.process_samples(num_samples=num_samples, start_index=0, use_batch_api=use_batch_api)
         
         print(f"\n✅ Integration complete! Added {added} examples to database.")
         print(f"\n📊 Processed {num_samples} samples, successfully added {added} SOAP examples")
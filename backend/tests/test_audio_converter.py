@@ -0,0 +1,63 @@
+"""
+Tests for silence-aligned audio chunking
+"""
+
+import shutil
+from io import BytesIO
+
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from app.services.audio_converter import AudioConverter
+
+
+def _tone(ms: int) -> AudioSegment:
+    return Sine(440).to_audio_segment(duration=ms, volume=-10).set_channels(1)
+
+
+def _speech_with_pauses() -> AudioSegment:
+    """25 s of tone with 1 s pauses at 9-10 s and 19.5-20.5 s"""
+    return (
+        _tone(9000) + AudioSegment.silent(1000)
+        + _tone(9500) + AudioSegment.silent(1000)
+        + _tone(4500)
+    )
+
+
+def test_cuts_move_to_nearest_pause():
+    audio = _speech_with_pauses()
+
+    cuts = AudioConverter._silence_cut_points(audio, chunk_ms=10_000, window_ms=3_000)
+
+    assert cuts[0] == 0 and cuts[-1] == len(audio)
+    assert len(cuts) == 4
+    assert 9000 <= cuts[1] <= 10000
+    assert 19500 <= cuts[2] <= 20500
+
+
+def test_hard_cut_without_pause():
+    audio = _tone(25_000)
+
+    cuts = AudioConverter._silence_cut_points(audio, chunk_ms=10_000, window_ms=3_000)
+
+    assert cuts == [0, 10_000, 20_000, 25_000]
+
+
+def test_short_audio_is_one_chunk():
+    audio = _tone(12_000)
+
+    assert AudioConverter._silence_cut_points(audio, chunk_ms=10_000, window_ms=3_000) == [0, 12_000]
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="MP3 export needs ffmpeg")
+def test_split_on_silence_chunks_covers_all_audio():
+    audio = _tone(60_000)
+    wav = BytesIO()
+    audio.export(wav, format="wav")
+
+    chunks = AudioConverter().split_on_silence_chunks(wav.getvalue(), "wav", chunk_seconds=10)
+
+    # The default 15 s window leaves the last 20 s as one chunk
+    assert [offset for _, offset in chunks] == [0, 10, 20, 30, 40]
+    assert all(data for data, _ in chunks)
@@ -0,0 +1,37 @@
+"""
+Tests for the Groq client's process-wide in-flight limit
+"""
+
+import asyncio
+import threading
+
+from app.config import settings
+from app.services import groq_client
+
+
+def test_slots_are_capped_across_event_loops():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    async def call():
+        nonlocal active, peak
+        async with groq_client.groq_slot():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            with lock:
+                active -= 1
+
+    async def consultation():
+        await asyncio.gather(*(call() for _ in range(settings.GROQ_CONCURRENCY)))
+
+    # Each consultation runs on its own thread and event loop, like the API's background work
+    threads = [threading.Thread(target=asyncio.run, args=(consultation(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert peak == settings.GROQ_CONCURRENCY
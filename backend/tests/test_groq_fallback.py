@@ -0,0 +1,68 @@
+"""
+Tests for the Groq service's fallback model and hedged requests
+"""
+
+import asyncio
+import importlib
+import types
+
+groq_backup = importlib.import_module("app.services.soap_service_groq_backup")
+
+
+class _Stream:
+    def __init__(self, model):
+        self.model = model
+
+    async def close(self):
+        pass
+
+
+class _Completions:
+    """Fake chat.completions: per-model delay, or an exception to raise"""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+
+    async def create(self, model, **params):
+        self.calls.append(model)
+        outcome = self.behaviour[model]
+        if isinstance(outcome, Exception):
+            raise outcome
+        await asyncio.sleep(outcome)
+        return _Stream(model)
+
+
+def _open(behaviour, hedge_after_ms):
+    service = groq_backup.SOAPGenerationService()
+    service.hedge_after_ms = hedge_after_ms
+    completions = _Completions(behaviour)
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    stream = asyncio.run(service._open_stream(client, {}))
+    return service, stream, completions.calls
+
+
+def test_slow_primary_is_not_hedged_by_default():
+    service, stream, calls = _open({"llama-3.1-8b-instant": 0.05}, hedge_after_ms=0)
+
+    assert stream.model == service.model
+    assert calls == [service.model]
+
+
+def test_model_error_falls_back():
+    behaviour = {
+        "llama-3.1-8b-instant": Exception("The model has been decommissioned"),
+        "llama-3.3-70b-versatile": 0,
+    }
+    service, stream, calls = _open(behaviour, hedge_after_ms=0)
+
+    assert stream.model == service.fallback_model
+    assert calls == [service.model, service.fallback_model]
+
+
+def test_hedge_fires_when_enabled():
+    behaviour = {"llama-3.1-8b-instant": 1.0, "llama-3.3-70b-versatile": 0}
+    service, stream, calls = _open(behaviour, hedge_after_ms=10)
+
+    assert stream.model == service.fallback_model
+    assert calls == [service.model, service.fallback_model]
@@ -0,0 +1,52 @@
+"""
+Tests for per-event-loop SDK clients
+"""
+
+import asyncio
+
+from app.services.loop_clients import aclose_loop_clients, get_loop_client
+
+
+class _Client:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def _get():
+    return get_loop_client("test", _Client, lambda client: client.aclose())
+
+
+async def _get_twice():
+    return await asyncio.gather(_get(), _get())
+
+
+def test_one_client_per_loop_closed_with_it():
+    loop = asyncio.new_event_loop()
+    try:
+        first, second = loop.run_until_complete(_get_twice())
+        loop.run_until_complete(aclose_loop_clients())
+        # A fresh client after the old one was closed
+        third = loop.run_until_complete(_get())
+        loop.run_until_complete(aclose_loop_clients())
+    finally:
+        loop.close()
+
+    assert first is second
+    assert first.closed
+    assert third is not first and third.closed
+
+
+def test_loops_do_not_share_clients():
+    clients = []
+    for _ in range(2):
+        loop = asyncio.new_event_loop()
+        try:
+            clients.append(loop.run_until_complete(_get()))
+            loop.run_until_complete(aclose_loop_clients())
+        finally:
+            loop.close()
+
+    assert clients[0] is not clients[1]
@@ -0,0 +1,31 @@
+"""
+Tests for SOAP markdown normalization in the PDF service
+"""
+
+import importlib
+
+pdf_service = importlib.import_module("app.services.pdf_service")
+
+
+def test_dash_without_leading_space_splits_bullets():
+    service = pdf_service.PDFService()
+
+    assert service._convert_to_bullet_points("fever- cough") == "- fever\n- cough"
+    assert service._convert_to_bullet_points("- fever. - cough.-cold") == "- fever\n- cough\n- cold"
+
+
+def test_flattened_markdown_is_reconstructed():
+    service = pdf_service.PDFService()
+    flattened = "## Subjective - fever - cough ## Objective - BP normal ## Plan - rest"
+
+    assert service._normalize_soap_markdown(flattened) == (
+        "## Subjective\n- fever\n- cough\n\n## Objective\n- BP normal\n\n## Plan\n- rest"
+    )
+
+
+def test_well_formed_markdown_is_unchanged():
+    service = pdf_service.PDFService()
+    markdown = "## Subjective\n- fever\n\n## Plan\n- rest"
+
+    assert service._normalize_soap_markdown(markdown) == markdown
+    assert service._normalize_soap_markdown("## Subjective") == "## Subjective"
@@ -0,0 +1,36 @@
+"""
+Tests for batched Groq SOAP generation
+"""
+
+import asyncio
+import importlib
+import threading
+
+groq_backup = importlib.import_module("app.services.soap_service_groq_backup")
+
+
+def test_batches_share_one_long_lived_event_loop():
+    service = groq_backup.SOAPGenerationService()
+    loops = []
+
+    async def generate_group(requests):
+        loops.append(asyncio.get_running_loop())
+        return [{"soap_note": request} for request in requests]
+
+    service._generate_group = generate_group
+
+    # Batches are generated on the queue's timer and worker threads
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(service._generate_batch([i, i + 1])))
+        for i in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert sorted(results, key=lambda r: r[0]["soap_note"]) == [
+        [{"soap_note": i}, {"soap_note": i + 1}] for i in range(3)
+    ]
+    assert len(set(map(id, loops))) == 1 and loops[0].is_running()
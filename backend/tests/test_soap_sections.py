@@ -0,0 +1,26 @@
+"""
+Tests for splitting markdown SOAP notes into sections
+"""
+
+from app.services.soap_sections import split_sections
+
+
+def test_sections_split_on_headers():
+    note = (
+        "# Consultation Note\n\n"
+        "## Subjective (S)\n- fever for 3 days\n- cough\n\n"
+        "## OBJECTIVE\n- BP 120/80\n\n"
+        "## Plan\n- paracetamol 500mg ## twice daily\n\n"
+        "## Plan\n- ignored duplicate"
+    )
+
+    assert split_sections(note) == {
+        "subjective": "- fever for 3 days\n- cough",
+        "objective": "- BP 120/80",
+        "plan": "- paracetamol 500mg ## twice daily",
+    }
+
+
+def test_note_without_sections():
+    assert split_sections("Patient seen, no structured note") == {}
+    assert split_sections("## Subjective") == {}
@@ -0,0 +1,64 @@
+"""
+Tests for the Gemini SOAP service
+"""
+
+import asyncio
+import importlib
+import types
+
+from app.services.semantic_cache import ExactCache
+
+gemini_soap = importlib.import_module("app.services.soap_service")
+
+
+def test_cache_key_includes_diarized_speech():
+    service = object.__new__(gemini_soap.SOAPGenerationService)
+    service.exact_cache = ExactCache()
+
+    plain = service._cache_key("fever for three days", "te", None, None)
+    diarized = service._cache_key("fever for three days", "te", "any fever?", "three days")
+
+    assert plain != diarized
+    assert diarized == service._cache_key("fever for three days", "te", "any fever?", "three days")
+
+
+class _Caches:
+    def __init__(self):
+        self.created = 0
+
+    async def create(self, model, config):
+        self.created += 1
+        return types.SimpleNamespace(name=f"cachedContents/{self.created}")
+
+
+class _PrefixCacheService(gemini_soap.SOAPGenerationService):
+    """Service with stubbed examples and Gemini client (no API key or data files)"""
+
+    def __init__(self, examples: str):
+        self._prompt_caches = {}
+        self._examples_text = examples
+        self.model_name = "gemini-2.0-flash"
+        self.caches = _Caches()
+
+    def _get_professional_examples(self, example_key=None):
+        return self._examples_text
+
+    def _aio(self):
+        return types.SimpleNamespace(caches=self.caches)
+
+
+def test_small_prompt_prefix_is_not_cached():
+    service = _PrefixCacheService("**Example:** fever and cough\n" * 100)
+
+    assert asyncio.run(service._get_cached_prefix("respiratory")) is None
+    assert asyncio.run(service._get_cached_prefix("respiratory")) is None
+    assert service.caches.created == 0
+
+
+def test_large_prompt_prefix_is_cached_once():
+    min_chars = gemini_soap.PROMPT_CACHE_MIN_TOKENS * gemini_soap._CHARS_PER_TOKEN
+    service = _PrefixCacheService("x" * min_chars)
+
+    assert asyncio.run(service._get_cached_prefix(None)) == "cachedContents/1"
+    assert asyncio.run(service._get_cached_prefix(None)) == "cachedContents/1"
+    assert service.caches.created == 1
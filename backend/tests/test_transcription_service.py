@@ -0,0 +1,89 @@
+"""
+Tests for the upstream transcription limit and parallel chunk transcription
+"""
+
+import asyncio
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# app.services re-exports the service instance under the module's name
+ts = importlib.import_module("app.services.transcription_service")
+
+
+class _FakeAssemblyAI:
+    """Stands in for assemblyai_service: blocking SDK work runs via to_thread"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def transcribe_with_diarization(self, audio_bytes=None, language="ta", enable_diarization=True, **_):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.to_thread(time.sleep, 0.01)
+        finally:
+            self.active -= 1
+        text = audio_bytes.decode()
+        return {
+            "text": text,
+            "doctor_text": f"doctor {text}",
+            "patient_text": f"patient {text}",
+            "confidence": 0.9,
+            "segments": [{"speaker": "A", "text": text, "start": 1000, "end": 2000}],
+            "duration": 120.0,
+            "cost": 0.6,
+        }
+
+
+def _run_with_small_executor(coro, workers):
+    """Run coro on a fresh loop whose default executor has only `workers` threads"""
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    try:
+        return loop.run_until_complete(asyncio.wait_for(coro, timeout=10))
+    finally:
+        loop.close()
+
+
+def test_more_requests_than_executor_threads_complete(monkeypatch):
+    fake = _FakeAssemblyAI()
+    monkeypatch.setattr(ts, "assemblyai_service", fake, raising=False)
+    monkeypatch.setattr(ts.settings, "TRANSCRIPTION_MAX_CONCURRENT", 5)
+    service = ts.TranscriptionService()
+
+    async def main():
+        return await asyncio.gather(*(
+            service._transcribe_with_assemblyai(str(i).encode(), "ta") for i in range(20)
+        ))
+
+    results = _run_with_small_executor(main(), workers=2)
+
+    assert [r["text"] for r in results] == [str(i) for i in range(20)]
+    assert fake.peak <= 5
+    # Every slot was handed back
+    assert service._upstream_slots.available == 5
+
+
+def test_parallel_chunks_are_bounded_and_stitched_in_order(monkeypatch):
+    fake = _FakeAssemblyAI()
+    monkeypatch.setattr(ts, "assemblyai_service", fake, raising=False)
+    monkeypatch.setattr(ts.settings, "TRANSCRIPTION_MAX_CONCURRENT", 3)
+    # A 40-minute recording: 20 chunks of 120 s
+    chunks = [(str(i).encode(), i * 120.0) for i in range(20)]
+    monkeypatch.setattr(ts.audio_converter, "split_on_silence_chunks", lambda *args: chunks)
+    service = ts.TranscriptionService()
+
+    result = _run_with_small_executor(service._transcribe_parallel_chunks(b"audio", "ta", "wav"), workers=2)
+
+    assert fake.peak <= 3
+    assert result["text"] == " ".join(str(i) for i in range(20))
+    assert result["doctor_text"].startswith("doctor 0 doctor 1 ")
+    assert [s["start"] for s in result["segments"]] == [i * 120_000 + 1000 for i in range(20)]
+    assert [s["end"] for s in result["segments"]] == [i * 120_000 + 2000 for i in range(20)]
+    assert result["duration"] == 20 * 120.0
+    assert result["cost"] == 12.0
+    assert result["confidence"] == pytest.approx(0.9)